@@ -1,22 +1,34 @@
 import secrets
 from uuid import uuid4
 import uuid
-from flask import Flask, Response, jsonify, render_template, request, redirect, send_file, session, url_for, flash, abort
+from flask import Flask, Response, jsonify, render_template, request, redirect, send_file, session, url_for, flash, abort, make_response
 from google.oauth2 import service_account
+from google.auth.credentials import AnonymousCredentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+import google_auth_httplib2
+import httplib2
 import os
 import json
 from datetime import datetime, date, timedelta
 import calendar
-from collections import defaultdict
-from flask_wtf.csrf import CSRFProtect
+import re
+import sys
+from collections import defaultdict, deque
+from flask_wtf.csrf import CSRFProtect, generate_csrf
 import pytz
 import requests
 import ssl
 from werkzeug.security import check_password_hash
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_session import Session
-from flask import send_from_directory
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from werkzeug.datastructures import CallbackDict
+import sqlite3
+from flask import send_from_directory, g, has_request_context
+from urllib.parse import quote, unquote, urlparse
 from docx import Document
 from docx.shared import Inches, Pt
 from docx.enum.table import WD_TABLE_ALIGNMENT, WD_ALIGN_VERTICAL
@@ -24,6 +36,18 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.ns import qn
 from io import BytesIO
 import qrcode
+from PIL import Image, ImageDraw, ImageFont
+import zipfile
+import zlib
+import itertools
+from functools import lru_cache
+import hashlib
+import mimetypes
+from markupsafe import Markup
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "fallback-if-missing")
@@ -41,22 +65,287 @@ if os.getenv("VERCEL") is None:
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 PDFSHIFT_API_KEY = os.getenv("PDFSHIFT_API_KEY")
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+# Arahkan ke server Sheets lokal (fake_sheets.py) untuk benchmark/pengembangan, mis. http://127.0.0.1:8085
+SHEETS_API_ENDPOINT = os.getenv("SHEETS_API_ENDPOINT")
 
 # Load credentials
-if os.getenv("VERCEL"):
-    # Dari environment variable GOOGLE_CREDENTIALS
-    service_account_info = json.loads(os.getenv("GOOGLE_CREDENTIALS", "{}"))
-    service_account_info['private_key'] = service_account_info['private_key'].replace('\\n', '\n')
-    credentials = service_account.Credentials.from_service_account_info(
-        service_account_info, scopes=SCOPES
-    )
-else:
-    # Dari file lokal
-    credentials = service_account.Credentials.from_service_account_file(
-        'inventaris-credentials.json', scopes=SCOPES
+_credentials_cache = {}
+
+def load_credentials(source=None):
+    """
+    source:
+      None            -> GOOGLE_CREDENTIALS (Vercel) atau file inventaris-credentials.json
+      "env:NAMA_VAR"  -> JSON service account dari environment variable NAMA_VAR
+      path file       -> file JSON service account
+    """
+    if SHEETS_API_ENDPOINT:
+        # Server lokal tidak memeriksa token
+        return AnonymousCredentials()
+    if source in _credentials_cache:
+        return _credentials_cache[source]
+
+    if source is None and os.getenv("VERCEL"):
+        source = "env:GOOGLE_CREDENTIALS"
+
+    if source and source.startswith("env:"):
+        # Dari environment variable
+        service_account_info = json.loads(os.getenv(source[4:], "{}"))
+        service_account_info['private_key'] = service_account_info['private_key'].replace('\\n', '\n')
+        credentials = service_account.Credentials.from_service_account_info(
+            service_account_info, scopes=SCOPES
+        )
+    else:
+        # Dari file lokal
+        credentials = service_account.Credentials.from_service_account_file(
+            source or 'inventaris-credentials.json', scopes=SCOPES
+        )
+
+    _credentials_cache[source] = credentials
+    return credentials
+
+#--- Lab (shard) ---
+# Setiap lab punya spreadsheet, kredensial, prefix kode barang, dan cache sendiri.
+# LABS_CONFIG berisi JSON (atau path ke file JSON), contoh:
+#   {"kimia":  {"nama": "Lab Kimia",  "spreadsheet_id": "...", "prefix": "KIM", "credentials": "env:KIMIA_CREDENTIALS"},
+#    "fisika": {"nama": "Lab Fisika", "spreadsheet_id": "...", "prefix": "FIS"}}
+# Prefix harus unik antar lab; kalau tidak diisi dipakai id lab dalam huruf besar ("kimia" -> "KIMIA").
+# Tanpa LABS_CONFIG, aplikasi berjalan dengan satu lab dari SPREADSHEET_ID dan prefix "LAB".
+LABS_CONFIG = os.getenv("LABS_CONFIG")
+
+class Lab:
+    def __init__(self, lab_id, nama, spreadsheet_id, prefix, credentials):
+        if not re.fullmatch(r"[a-z0-9_-]+", lab_id):
+            raise ValueError(f"ID lab '{lab_id}' hanya boleh huruf kecil, angka, '-' dan '_'")
+        self.id = lab_id
+        self.nama = nama
+        self.spreadsheet_id = spreadsheet_id
+        self.prefix = prefix
+        self.credentials = credentials
+
+        # httplib2.Http tidak thread-safe, sedangkan Sheets juga dipanggil dari thread job & fan-out.
+        # Setiap thread memakai koneksi sendiri (tetap keep-alive di dalam thread itu).
+        self._http_local = threading.local()
+        self.service = build(
+            'sheets', 'v4',
+            credentials=credentials,
+            requestBuilder=self._build_request,
+            client_options={"api_endpoint": SHEETS_API_ENDPOINT} if SHEETS_API_ENDPOINT else None
+        )
+
+        # Versi data & cache, lihat bagian "Versi data & cache"
+        self.lock = threading.Lock()
+        self.version = 0
+        self.data_cache = {}      # sheet_name -> (waktu_ambil, records, {key: record})
+        self.fragment_cache = {}  # (template, version) -> Markup
+        self.change_log = deque()  # (version, sheet, op, key, row)
+        self.change_log_floor = 0  # perubahan dengan versi <= ini sudah dibuang dari log
+        self.loan_index = (None, {})  # (entry Peminjaman di data_cache, {kode_barang: [Peminjaman]}), lihat "Scan QR"
+
+    def _thread_http(self):
+        http = getattr(self._http_local, "http", None)
+        if http is None:
+            http = self._http_local.http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return http
+
+    def _build_request(self, http, *args, **kwargs):
+        return HttpRequest(self._thread_http(), *args, **kwargs)
+
+    def sheets(self):
+        return self.service.spreadsheets()
+
+def load_labs():
+    if not LABS_CONFIG:
+        return {"lab": Lab("lab", "Lab", SPREADSHEET_ID, "LAB", load_credentials())}
+
+    config = LABS_CONFIG
+    if not config.lstrip().startswith("{"):
+        with open(config) as f:
+            config = f.read()
+
+    labs = {}
+    prefixes = {}
+    for lab_id, cfg in json.loads(config).items():
+        # Prefix menentukan lab pemilik kode barang (lihat labs_for_kode), jadi harus unik
+        # dan tanpa "-"; default-nya diturunkan dari id lab
+        prefix = cfg.get("prefix") or lab_id.upper().replace("-", "_")
+        if "-" in prefix:
+            raise ValueError(f"Prefix lab '{lab_id}' tidak boleh mengandung '-': {prefix}")
+        if prefix in prefixes:
+            raise ValueError(f"Prefix '{prefix}' dipakai oleh lab '{prefixes[prefix]}' dan '{lab_id}'")
+        prefixes[prefix] = lab_id
+
+        labs[lab_id] = Lab(
+            lab_id,
+            cfg.get("nama", lab_id),
+            cfg["spreadsheet_id"],
+            prefix,
+            load_credentials(cfg.get("credentials"))
+        )
+    return labs
+
+LABS = load_labs()
+DEFAULT_LAB = LABS[os.getenv("DEFAULT_LAB", next(iter(LABS)))]
+_lab_by_spreadsheet = {lab.spreadsheet_id: lab.id for lab in LABS.values()}
+
+def current_lab():
+    """
+    Lab untuk request ini (dipilih lewat ?lab= atau session), atau lab default di luar request.
+    """
+    if has_request_context() and g.get("lab") is not None:
+        return g.lab
+    return DEFAULT_LAB
+
+## Metrics & tracing
+# Metrik disimpan di memori per proses dan diekspor dalam format teks Prometheus di /metrics.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # kalau diisi, /metrics butuh header "Authorization: Bearer <token>"
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", "0"))  # 0 = log request lambat nonaktif
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS_HELP = {
+    "http_request_duration_seconds": ("histogram", "Waktu proses request per route"),
+    "sheets_request_duration_seconds": ("histogram", "Waktu panggilan Google Sheets API per operasi & range"),
+    "sheets_errors_total": ("counter", "Panggilan Google Sheets API yang gagal"),
+    "sheets_quota_errors_total": ("counter", "Panggilan Google Sheets API yang kena kuota (HTTP 429)"),
+    "cache_requests_total": ("counter", "Hit/miss cache data, fragmen & ETag"),
+    "label_build_duration_seconds": ("histogram", "Waktu pembuatan label per tahap (qr, docx, save)"),
+    "pdfshift_duration_seconds": ("histogram", "Waktu konversi PDF lewat PDFShift"),
+}
+
+metrics_lock = threading.Lock()
+_histograms = {}  # (nama, labels) -> [count per bucket..., count, sum]
+_counters = {}    # (nama, labels) -> nilai
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def observe(name, seconds, **labels):
+    key = (name, _label_key(labels))
+    with metrics_lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(METRICS_BUCKETS) + 2)
+        for i, bound in enumerate(METRICS_BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+        hist[-2] += 1
+        hist[-1] += seconds
+
+def inc(name, amount=1, **labels):
+    key = (name, _label_key(labels))
+    with metrics_lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
     )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+def render_metrics():
+    with metrics_lock:
+        histograms = {key: list(value) for key, value in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    for name, (kind, help_text) in METRICS_HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        else:
+            for (metric, labels), hist in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(METRICS_BUCKETS, hist):
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist[-2]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {hist[-2]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {hist[-1]:.6f}")
+    return "\n".join(lines) + "\n"
+
+def _trace(label, seconds):
+    # Rincian waktu per request untuk log request lambat
+    if has_request_context() and "trace" in g:
+        g.trace.append((label, seconds))
+
+def _sheets_call_labels(req):
+    # "sheets.spreadsheets.values.get" -> "spreadsheets.values.get"
+    op = (getattr(req, "methodId", None) or "unknown").replace("sheets.", "", 1)
+
+    # Range diambil dari URI (sebelum di-unquote, karena ":" di range ikut di-encode
+    # sedangkan ":append" tidak); nomor baris dibuang supaya jumlah label tetap kecil
+    range_name = ""
+    path = urlparse(getattr(req, "uri", "")).path
+    spreadsheet_id = path.split("/spreadsheets/", 1)[-1].split("/", 1)[0].split(":", 1)[0]
+    lab_id = _lab_by_spreadsheet.get(spreadsheet_id, "unknown")
+    if "/values/" in path:
+        range_name = unquote(path.split("/values/", 1)[1].split(":", 1)[0])
+        if "!" in range_name:
+            sheet, cells = range_name.rsplit("!", 1)
+            range_name = sheet + "!" + re.sub(r"\d+", "", cells)
+    return op, range_name, lab_id
+
+def sheets_execute(req):
+    """
+    Pengganti `req.execute()` untuk semua panggilan Sheets API, supaya waktu & error tercatat.
+    """
+    op, range_name, lab_id = _sheets_call_labels(req)
+    start = time.perf_counter()
+    try:
+        return req.execute()
+    except HttpError as e:
+        status = getattr(e.resp, "status", 0)
+        inc("sheets_errors_total", op=op, status=status, lab=lab_id)
+        if status == 429:
+            inc("sheets_quota_errors_total", op=op, lab=lab_id)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("sheets_request_duration_seconds", elapsed, op=op, range=range_name, lab=lab_id)
+        _trace(f"sheets {op} {range_name}".strip(), elapsed)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.trace = []
+
+# Endpoint file statis: tidak butuh lab maupun session, dan responsnya boleh di-cache publik
+STATIC_ENDPOINTS = {"asset", "static", "service_worker"}
+
+@app.before_request
+def select_lab():
+    if request.endpoint in STATIC_ENDPOINTS:
+        return
+    lab_id = request.args.get("lab") or session.get("lab")
+    g.lab = LABS.get(lab_id, DEFAULT_LAB)
+
+@app.after_request
+def record_request_metrics(response):
+    if "request_start" not in g:
+        return response
+
+    elapsed = time.perf_counter() - g.request_start
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    observe("http_request_duration_seconds", elapsed, route=route, method=request.method, status=response.status_code)
+
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        breakdown = ", ".join(f"{label}={seconds * 1000:.1f}ms" for label, seconds in g.trace)
+        app.logger.warning(
+            "Slow request %s %s %d %.1fms [%s]",
+            request.method, request.path, response.status_code, elapsed * 1000, breakdown or "-"
+        )
+    return response
 
-sheets_service = build('sheets', 'v4', credentials=credentials)
+@app.route("/metrics")
+def metrics():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        abort(401)
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
 
 
 ## OTHERS
@@ -64,6 +353,8 @@ sheets_service = build('sheets', 'v4', credentials=credentials)
 @app.template_filter("format_date")
 def format_date(value):
     from datetime import datetime
+    if isinstance(value, date):
+        return value.strftime("%d/%m/%Y")
     try:
         dt = datetime.strptime(value, "%Y-%m-%d")
         return dt.strftime("%d/%m/%Y")
@@ -97,14 +388,19 @@ def monthname_filter(m):
 @app.context_processor
 def inject_now():
     return {'now': datetime.now}
+
+@app.context_processor
+def inject_labs():
+    return {'labs': LABS.values(), 'current_lab': current_lab()}
  
 
 # PDFSHIFT Configuration
 def pdf_with_pdfshift(html_content, filename="report.pdf"):
     if not PDFSHIFT_API_KEY:
-        print("PDFSHIFT_API_KEY not found in environment variables.")
+        app.logger.error("PDFSHIFT_API_KEY not found in environment variables.")
         return False
 
+    start = time.perf_counter()
     response = requests.post(
         "https://api.pdfshift.io/v3/convert/pdf",
         headers={
@@ -116,13 +412,14 @@ def pdf_with_pdfshift(html_content, filename="report.pdf"):
             "use_print": False
         }
     )
+    observe("pdfshift_duration_seconds", time.perf_counter() - start, status=response.status_code)
 
     if response.status_code == 200:
         with open(filename, "wb") as f:
             f.write(response.content)
         return True
     else:
-        print("PDFShift Error:", response.text)
+        app.logger.error("PDFShift Error: %s", response.text)
         return False
 
 #session cookie
@@ -130,18 +427,176 @@ app.config['WTF_CSRF_SECRET_KEY'] = os.getenv("WTF_CSRF_SECRET_KEY", "your-rando
 app.config['SESSION_COOKIE_SECURE'] = True  # Karena di Vercel pakai HTTPS
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
+#--- Session store ---
+# SESSION_BACKEND:
+#   "cookie" (default) -> session Flask biasa di cookie bertanda tangan, cocok untuk Vercel/serverless
+#   "sqlite"           -> session di satu file SQLite (dibagi semua worker), untuk server sendiri (gunicorn)
+#   lainnya            -> diteruskan ke Flask-Session sebagai SESSION_TYPE (redis, memcached, mongodb, ...)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "cookie")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(tempfile.gettempdir(), "catat-inventaris-sessions.db"))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "300"))  # detik antar pembersihan session kedaluwarsa
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+class SqliteSessionInterface(SessionInterface):
+    """
+    Semua session dalam satu tabel SQLite (bukan satu file per session), dibaca lewat
+    primary key di setiap request. Tidak ada cache di memori: cache per proses tetap butuh
+    query ke SQLite untuk memastikan session tidak di-logout/diubah worker lain, jadi
+    hematnya hanya parse JSON kecil. Dengan WAL pembacaan ini tidak saling mengunci.
+    Session kedaluwarsa dihapus berkala berdasarkan kolom `expires`.
+    """
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, path, sweep_interval):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._last_sweep = 0
+
+        db = self._db()
+        db.execute("CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+        db.commit()
+
+    def _db(self):
+        # Koneksi SQLite per thread
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _load(self, sid):
+        # Satu query primary key per request; isi session di-parse oleh open_session
+        return self._db().execute(
+            "SELECT expires, data FROM sessions WHERE sid = ? AND expires > ?", (sid, time.time())
+        ).fetchone()
+
+    def _delete(self, sid):
+        db = self._db()
+        db.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        db.commit()
+
+    def regenerate(self, session):
+        """
+        Ganti sid session (dipanggil saat login), sama seperti regenerate() di Flask-Session,
+        supaya sid yang sempat diketahui orang lain tidak ikut terautentikasi.
+        """
+        if not session.new:
+            self._delete(session.sid)
+        session.sid = secrets.token_urlsafe(32)
+        session.modified = True
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        db = self._db()
+        db.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+        db.commit()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and len(sid) <= 64:
+            loaded = self._load(sid)
+            if loaded is not None:
+                session_obj = ServerSession(self.serializer.loads(loaded[1]), sid=sid)
+                session_obj.expires = loaded[0]
+                return session_obj
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        self._maybe_sweep()
+
+        if not session:
+            if session.modified and not session.new:
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        expires = time.time() + lifetime
+        # Tanpa perubahan, masa berlaku cukup diperpanjang saat sudah lewat separuh,
+        # supaya request biasa tidak menulis ke disk
+        stale = getattr(session, "expires", 0) - time.time() < lifetime / 2
+        if session.modified or session.new or stale:
+            data = self.serializer.dumps(dict(session))
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                (session.sid, data, expires)
+            )
+            db.commit()
+        elif not self.should_set_cookie(app, session):
+            return
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+if SESSION_BACKEND == "sqlite":
+    app.session_interface = SqliteSessionInterface(
+        SESSION_DB_PATH, SESSION_SWEEP_INTERVAL
+    )
+elif SESSION_BACKEND != "cookie":
+    app.config['SESSION_TYPE'] = SESSION_BACKEND
+    Session(app)
+
+class StaticSkippingSessionInterface(SessionInterface):
+    """
+    Membungkus session interface mana pun supaya respons STATIC_ENDPOINTS tidak menyimpan
+    session: tanpa Set-Cookie maupun "Vary: Cookie" (Flask-Login selalu menyentuh session
+    di after_request), karena respons itu di-cache publik.
+    """
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def open_session(self, app, request):
+        # Endpoint belum diketahui di sini (URL dicocokkan setelah session dibuka)
+        return self.inner.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        if request.endpoint in STATIC_ENDPOINTS:
+            return
+        return self.inner.save_session(app, session, response)
+
+app.session_interface = StaticSkippingSessionInterface(app.session_interface)
+
 # Login management
 login_manager = LoginManager()
 login_manager.login_view = 'login'
 login_manager.init_app(app)
 
-# username & password admin from googlesheet
+# username & password admin from googlesheet (selalu dari lab default)
 def get_accounts_from_sheet():
-    sheet = sheets_service.spreadsheets()
-    result = sheet.values().get(
-        spreadsheetId=SPREADSHEET_ID,
+    sheet = DEFAULT_LAB.sheets()
+    result = sheets_execute(sheet.values().get(
+        spreadsheetId=DEFAULT_LAB.spreadsheet_id,
         range="Profil!A2:B"  # Asumsikan header di baris 1
-    ).execute()
+    ))
     
     values = result.get('values', [])
     # Buat dict: {username: password}
@@ -167,6 +622,9 @@ def login():
         # Autentikasi dari sheet
         if username_input in accounts and check_password_hash(accounts[username_input], password_input):
             user = AdminUser(username_input)
+            # Session server-side (sqlite, redis, ...) mendapat sid baru saat login (anti session fixation)
+            if hasattr(app.session_interface, "regenerate"):
+                app.session_interface.regenerate(session)
             login_user(user, remember=True)
             return redirect(url_for('dashboard'))
         else:
@@ -181,63 +639,423 @@ def logout():
     return redirect(url_for('login'))
 
 
+#--- Model data ---
+# Baris sheet di-parse sekali saat dibaca lalu disimpan di cache sebagai objek ber-__slots__.
+# Baris yang pendek (sel kosong di ujung tidak dikirim oleh Sheets API) diisi string kosong.
+def _cell(row, i):
+    return str(row[i]).strip() if i < len(row) else ""
+
+def _parse_date(value):
+    # Tanggal yang tidak bisa di-parse tetap disimpan apa adanya
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        return value
+
+def _parse_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+class Barang:
+    __slots__ = ("kode_barang", "nama_barang", "merek", "jumlah", "tanggal", "kondisi", "keterangan")
+
+    def __init__(self, kode_barang, nama_barang, merek, jumlah, tanggal, kondisi, keterangan):
+        self.kode_barang = kode_barang
+        self.nama_barang = nama_barang
+        self.merek = merek
+        self.jumlah = jumlah          # int, atau string asli kalau bukan angka
+        self.tanggal = tanggal        # date, atau string asli kalau formatnya tidak dikenal
+        self.kondisi = kondisi
+        self.keterangan = keterangan
+
+    @property
+    def key(self):
+        return self.kode_barang
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            _cell(row, 0),
+            _cell(row, 1),
+            _cell(row, 2),
+            _parse_int(_cell(row, 3)),
+            _parse_date(_cell(row, 4)),
+            sys.intern(_cell(row, 5)),  # nilai kondisi sedikit & berulang
+            _cell(row, 6),
+        )
+
+    def to_row(self):
+        tanggal = self.tanggal.isoformat() if isinstance(self.tanggal, date) else self.tanggal
+        return [self.kode_barang, self.nama_barang, self.merek, str(self.jumlah), tanggal, self.kondisi, self.keterangan]
+
+    def to_dict(self):
+        return {
+            "kode_barang": self.kode_barang,
+            "nama_barang": self.nama_barang,
+            "merek": self.merek,
+            "jumlah": self.jumlah,
+            "tanggal": self.tanggal.isoformat() if isinstance(self.tanggal, date) else self.tanggal,
+            "kondisi": self.kondisi,
+            "keterangan": self.keterangan,
+        }
+
+class Peminjaman:
+    __slots__ = ("nomor", "nama", "instansi", "telp", "kode_barang", "nama_barang", "merek")
+
+    def __init__(self, nomor, nama, instansi, telp, kode_barang, nama_barang, merek):
+        self.nomor = nomor
+        self.nama = nama
+        self.instansi = instansi
+        self.telp = telp
+        self.kode_barang = kode_barang
+        self.nama_barang = nama_barang
+        self.merek = merek
+
+    @property
+    def key(self):
+        return self.nomor
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*(_cell(row, i) for i in range(7)))
+
+    def to_row(self):
+        return [self.nomor, self.nama, self.instansi, self.telp, self.kode_barang, self.nama_barang, self.merek]
+
+RECORD_MODELS = {"Barang": Barang, "Peminjaman": Peminjaman}
+
+def parse_rows(sheet_name, values):
+    model = RECORD_MODELS[sheet_name]
+    return [model.from_row(row) for row in values if row]
+
+#--- Versi data & cache ---
+# Setiap penulisan ke sheet menaikkan versi data lab tersebut. Versi ini dipakai untuk ETag
+# halaman dan sebagai kunci cache fragmen template, jadi halaman yang datanya tidak berubah
+# tidak perlu membaca Sheets maupun merender ulang tabel. Semua state ini ada di objek Lab.
+DATA_CACHE_TTL = int(os.getenv("DATA_CACHE_TTL", "30"))  # detik sebelum data dibaca ulang dari Sheets
+# Beda tiap proses, supaya ETag/token dari proses lain tidak dianggap sama. Akibatnya token
+# /api/changes dari proses lain (worker lain, instance serverless lain) selalu berujung reset.
+DATA_EPOCH = uuid4().hex[:8]
+CHANGE_LOG_SIZE = int(os.getenv("CHANGE_LOG_SIZE", "5000"))  # jumlah perubahan yang disimpan untuk /api/changes
+
+def bump_data_version(sheet=None, changes=(), lab=None):
+    """
+    Dipanggil oleh semua jalur tulis (tambah, edit, hapus, peminjaman).
+    `changes` berisi tuple (op, key, row) dengan op "upsert" atau "delete",
+    dicatat di change log untuk delta sync.
+    """
+    lab = lab or current_lab()
+    model = RECORD_MODELS.get(sheet)
+    if model:
+        # Simpan bentuk baris yang sudah dinormalisasi, sama seperti snapshot /api/changes
+        changes = [(op, key, model.from_row(row).to_row() if row else row) for op, key, row in changes]
+
+    with lab.lock:
+        _record_changes(lab, sheet, changes)
+
+def _record_changes(lab, sheet, changes):
+    # Harus dipanggil sambil memegang lab.lock
+    lab.version += 1
+    lab.fragment_cache.clear()
+
+    # Cache data tidak dibuang, hanya ditandai basi (waktu ambil 0): isinya tetap jadi
+    # pembanding untuk mendeteksi edit langsung di Google Sheets saat dibaca ulang.
+    # Perubahan dari aplikasi sendiri diterapkan ke pembanding supaya tidak tercatat dua kali.
+    for name, (_, records, index) in list(lab.data_cache.items()):
+        if name == sheet and changes:
+            model = RECORD_MODELS[name]
+            index = dict(index)
+            for op, key, row in changes:
+                if op == "delete":
+                    index.pop(key, None)
+                else:
+                    index[key] = model.from_row(row)
+            records = list(index.values())
+        lab.data_cache[name] = (0, records, index)
+
+    for op, key, row in changes:
+        lab.change_log.append((lab.version, sheet, op, key, row))
+    while len(lab.change_log) > CHANGE_LOG_SIZE:
+        lab.change_log_floor = lab.change_log.popleft()[0]
+
+def diff_records(old_records, new_records):
+    """
+    Bandingkan dua isi sheet berdasarkan key (kode/nomor),
+    hasilnya daftar (op, key, row) untuk bump_data_version.
+    """
+    old_rows = {record.key: record.to_row() for record in old_records}
+    new_rows = {record.key: record.to_row() for record in new_records}
+
+    changes = [("upsert", key, row) for key, row in new_rows.items() if old_rows.get(key) != row]
+    changes += [("delete", key, None) for key in old_rows if key not in new_rows]
+    return changes
+
+def version_token(version, lab=None):
+    lab = lab or current_lab()
+    return f"{DATA_EPOCH}.{lab.id}.{version}"
+
+def changes_since(sheet_name, token, lab=None):
+    """
+    Mengembalikan (upserted, deleted) sejak versi `token`, atau None kalau token
+    tidak bisa dipakai (proses/lab lain, terlalu lama, atau tidak valid) dan klien
+    harus mengambil snapshot penuh.
+    """
+    lab = lab or current_lab()
+    try:
+        epoch, lab_id, since = token.split(".")
+        since = int(since)
+    except (AttributeError, ValueError):
+        return None
+
+    with lab.lock:
+        if epoch != DATA_EPOCH or lab_id != lab.id or since < lab.change_log_floor or since > lab.version:
+            return None
+        entries = [entry for entry in lab.change_log if entry[0] > since and entry[1] == sheet_name]
+
+    # Ambil status terakhir per key
+    latest = {}
+    for _, _, op, key, row in entries:
+        latest[key] = (op, row)
+
+    upserted = [row for op, row in latest.values() if op == "upsert"]
+    deleted = [key for key, (op, _) in latest.items() if op == "delete"]
+    return upserted, deleted
+
 #--- Ambil data dari Google Sheets ---
-def get_data(sheet_name):
-    result = sheets_service.spreadsheets().values().get(
-        spreadsheetId=SPREADSHEET_ID,
+def get_data(sheet_name, lab=None):
+    lab = lab or current_lab()
+    result = sheets_execute(lab.sheets().values().get(
+        spreadsheetId=lab.spreadsheet_id,
         range=f"{sheet_name}!A2:G"
-    ).execute()
+    ))
 
     values = result.get('values', [])
     return values
 
+def _load_records(sheet_name, lab):
+    cached = lab.data_cache.get(sheet_name)
+    if cached and time.time() - cached[0] < DATA_CACHE_TTL:
+        inc("cache_requests_total", cache="records", result="hit")
+        return cached
+    inc("cache_requests_total", cache="records", result="miss")
+
+    # Versi dicatat sebelum membaca: kalau ada penulisan selama Sheets dibaca, hasil bacaan
+    # ini mungkin masih data lama dan tidak boleh disimpan sebagai data versi yang baru
+    version = lab.version
+    records = parse_rows(sheet_name, get_data(sheet_name, lab))
+    entry = (time.time(), records, {record.key: record for record in records})
+
+    # Sheet bisa diubah langsung dari Google Sheets; kalau isinya beda dengan cache lama,
+    # anggap sebagai penulisan baru supaya ETag & fragmen ikut kedaluwarsa
+    changes = diff_records(cached[1], records) if cached else []
+
+    with lab.lock:
+        if lab.version != version:
+            return entry  # dipakai untuk request ini saja, request berikutnya membaca ulang
+        if changes:
+            _record_changes(lab, sheet_name, changes)
+        lab.data_cache[sheet_name] = entry
+    return entry
+
+def get_records(sheet_name, lab=None):
+    """
+    Daftar record (Barang/Peminjaman) dari cache, dibaca ulang dari Sheets setelah DATA_CACHE_TTL.
+    """
+    return _load_records(sheet_name, lab or current_lab())[1]
+
+def get_record_index(sheet_name, lab=None):
+    # {kode_barang/nomor: record}
+    return _load_records(sheet_name, lab or current_lab())[2]
+
+def render_fragment(template_name, version, **context):
+    """
+    Render potongan template sekali per versi data lab aktif, lalu simpan hasilnya.
+    `version` diambil sebelum membaca data supaya hasil render tidak pernah
+    disimpan dengan versi yang lebih baru dari datanya.
+    """
+    lab = current_lab()
+    key = (template_name, version)
+    html = lab.fragment_cache.get(key)
+    if html is None:
+        inc("cache_requests_total", cache="fragment", result="miss")
+        html = Markup(render_template(template_name, **context))
+        lab.fragment_cache[key] = html
+    else:
+        inc("cache_requests_total", cache="fragment", result="hit")
+    return html
+
+def page_etag(name, version):
+    # `version` adalah lab.version yang dibaca sebelum data diambil, bukan versi saat ini:
+    # halaman yang dirender dari pembacaan yang tumpang tindih dengan penulisan tidak boleh
+    # mendapat ETag versi sesudah penulisan.
+    # Halaman juga memuat token CSRF milik sesi & tanggal hari ini, jadi keduanya ikut di ETag.
+    # Bucket 30 menit menjaga token CSRF di halaman yang di-cache tetap dalam WTF_CSRF_TIME_LIMIT.
+    generate_csrf()
+    lab = current_lab()
+    raw = "|".join(str(part) for part in (
+        name,
+        DATA_EPOCH,
+        lab.id,
+        version,
+        date.today(),
+        session.get('csrf_token', ''),
+        int(time.time() // 1800),
+    ))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def not_modified(etag):
+    hit = request.if_none_match.contains(etag)
+    inc("cache_requests_total", cache="etag", result="hit" if hit else "miss")
+    return hit
+
+def conditional_response(html, etag):
+    response = make_response(html)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 # Simpan data ke sheet Peminjaman
-def simpan_peminjaman(data_rows):
+def simpan_peminjaman(data_rows, lab=None):
+    lab = lab or current_lab()
     body = {
         "values": data_rows
     }
-    sheets_service.spreadsheets().values().append(
-        spreadsheetId=SPREADSHEET_ID,
+    sheets_execute(lab.sheets().values().append(
+        spreadsheetId=lab.spreadsheet_id,
         range="Peminjaman!A2",
         valueInputOption="USER_ENTERED",
         body=body
-    ).execute()
+    ))
+    bump_data_version("Peminjaman", [("upsert", row[0], row) for row in data_rows], lab)
     
 # Home page    
 @app.route("/")
 def index():
     return redirect(url_for("inventaris"))
 
+# Service worker dilayani dari root supaya scope-nya mencakup seluruh aplikasi
+@app.route("/service-worker.js")
+def service_worker():
+    response = send_from_directory(app.static_folder, "service-worker.js", mimetype="application/javascript")
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+#--- Aset statis ---
+# build_assets.py menyalin library vendor ke static/vendor, memberi hash isi pada nama file
+# (static/dist/) dan menulis static/dist/manifest.json. Tanpa manifest, asset_url() kembali
+# ke file static biasa, atau ke CDN untuk library vendor yang belum diunduh.
+ASSET_DIR = os.path.join(app.static_folder, "dist")
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+def _load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+ASSET_MANIFEST = _load_json(os.path.join(ASSET_DIR, "manifest.json"))
+VENDOR_CDN = _load_json(os.path.join(app.static_folder, "vendor.json"))
+
+@app.template_global()
+def asset_url(filename):
+    """
+    Pengganti url_for('static', filename=...) yang memakai nama file ber-hash kalau ada.
+    """
+    hashed = ASSET_MANIFEST.get(filename)
+    if hashed:
+        return url_for("asset", filename=hashed)
+    if filename in VENDOR_CDN and not os.path.exists(os.path.join(app.static_folder, filename)):
+        return VENDOR_CDN[filename]
+    return url_for("static", filename=filename)
+
+@app.route("/assets/<path:filename>")
+def asset(filename):
+    # Nama file sudah mengandung hash isi, jadi boleh di-cache selamanya
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    for encoding, ext in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(ASSET_DIR, filename + ext)):
+            response = send_from_directory(ASSET_DIR, filename + ext, mimetype=mimetype)
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(ASSET_DIR, filename, mimetype=mimetype)
+
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    response.vary.add("Accept-Encoding")
+    return response
+
+#--- Delta sync ---
+SYNC_SHEETS = ("Barang", "Peminjaman")
+
+@app.route("/api/changes")
+def api_changes():
+    """
+    ?since=<token>&sheet=Barang -> hanya baris yang berubah sejak token.
+    Tanpa token (atau token kedaluwarsa) -> snapshot penuh dengan "reset": true.
+
+    Batasan: token dan change log hanya ada di memori satu proses (lihat DATA_EPOCH).
+    Request yang sampai ke worker gunicorn lain, instance Vercel lain, atau proses baru
+    setelah cold start selalu mendapat "reset": true beserta isi sheet penuh. Delta
+    hanya menghemat transfer selama klien terus dilayani proses yang sama.
+    """
+    sheet_name = request.args.get("sheet", "Barang").capitalize()
+    if sheet_name not in SYNC_SHEETS:
+        return jsonify({"status": "error", "message": f"Sheet '{sheet_name}' tidak didukung"}), 400
+
+    # Versi diambil sebelum membaca: tulisan yang selesai di tengah pembacaan mungkin tidak
+    # ada di snapshot, jadi harus tetap muncul di delta berikutnya (delta ganda aman, yang
+    # terlewat tidak). Pembacaan juga memasukkan edit langsung di Google Sheets ke change log.
+    version = current_lab().version
+    records = get_records(sheet_name)
+    token = version_token(version)
+
+    delta = changes_since(sheet_name, request.args.get("since"))
+    if delta is None:
+        rows = [record.to_row() for record in records]
+        data = {"sheet": sheet_name, "version": token, "reset": True, "rows": rows}
+    else:
+        upserted, deleted = delta
+        data = {"sheet": sheet_name, "version": token, "reset": False, "upserted": upserted, "deleted": deleted}
+
+    response = jsonify(data)
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
 
 # Dashboard page
 
 
 # generate kode barang
-def generate_kode_barang(sheet_name="Barang"):
-    data = sheets_service.spreadsheets().values().get(
-        spreadsheetId=SPREADSHEET_ID,
+def generate_kode_barang(sheet_name="Barang", lab=None):
+    lab = lab or current_lab()
+    prefix = f"{lab.prefix}-"
+    data = sheets_execute(lab.sheets().values().get(
+        spreadsheetId=lab.spreadsheet_id,
         range=f"{sheet_name}!A2:A"
-    ).execute().get('values', [])
+    )).get('values', [])
 
     if not data:
-        return "LAB-001"
+        return f"{prefix}001"
 
     # Ambil kode terakhir yang valid
     kode_terakhir = ""
     for row in reversed(data):
-        if row and row[0].startswith("LAB-"):
+        if row and row[0].startswith(prefix):
             kode_terakhir = row[0]
             break
 
     if kode_terakhir:
         try:
-            nomor_terakhir = int(kode_terakhir.replace("LAB-", ""))
+            nomor_terakhir = int(kode_terakhir.replace(prefix, ""))
         except ValueError:
             nomor_terakhir = 0
     else:
         nomor_terakhir = 0
 
-    kode_baru = f"LAB-{nomor_terakhir + 1:03}"
+    kode_baru = f"{prefix}{nomor_terakhir + 1:03}"
     return kode_baru
 
 # Income page
@@ -256,20 +1074,29 @@ def inventaris():
 
             values = [[kode_barang, nama_barang, merek, jumlah, date_inventaris, kondisi, keterangan]]
 
-            sheets_service.spreadsheets().values().append(
-                spreadsheetId=SPREADSHEET_ID,
+            lab = current_lab()
+            sheets_execute(lab.sheets().values().append(
+                spreadsheetId=lab.spreadsheet_id,
                 range="Barang!A2:G",
                 valueInputOption="USER_ENTERED",
                 body={"values": values}
-            ).execute()
+            ))
+            bump_data_version("Barang", [("upsert", kode_barang, values[0])])
 
             return jsonify({"status": "success"})
         except Exception as e:
             return jsonify({"status": "error", "message": str(e)})
-        
-    inventaris_data = get_data("Barang")
-        
-    return render_template("inventaris.html", records=inventaris_data, today=date.today())
+
+    version = current_lab().version
+    inventaris_data = get_records("Barang")
+
+    etag = page_etag("inventaris", version)
+    if not_modified(etag):
+        return conditional_response("", etag), 304
+
+    rows_html = render_fragment("inventaris-rows.html", version, records=inventaris_data)
+    html = render_template("inventaris.html", rows_html=rows_html, today=date.today())
+    return conditional_response(html, etag)
 
 
 # Edit record
@@ -283,14 +1110,15 @@ def edit_record(sheet, kode_barang):
     keterangan = request.form.get("keterangan")
 
     # Ambil semua data
-    data = sheets_service.spreadsheets().values().get(
-        spreadsheetId=SPREADSHEET_ID,
+    lab = current_lab()
+    data = sheets_execute(lab.sheets().values().get(
+        spreadsheetId=lab.spreadsheet_id,
         range=f"{sheet.capitalize()}!A2:G"
-    ).execute().get('values', [])
+    )).get('values', [])
 
     # Cari baris berdasarkan Kode Barang
     for index, row in enumerate(data, start=2):  # mulai dari baris ke-2
-        if row[0] == kode_barang:
+        if row and row[0] == kode_barang:
             values = [[
                 kode_barang,
                 nama_barang,
@@ -300,21 +1128,23 @@ def edit_record(sheet, kode_barang):
                 kondisi,
                 keterangan
             ]]
-            sheets_service.spreadsheets().values().update(
-                spreadsheetId=SPREADSHEET_ID,
+            sheets_execute(lab.sheets().values().update(
+                spreadsheetId=lab.spreadsheet_id,
                 range=f"{sheet.capitalize()}!A{index}:G{index}",
                 valueInputOption="USER_ENTERED",
                 body={"values": values}
-            ).execute()
+            ))
+            bump_data_version(sheet.capitalize(), [("upsert", kode_barang, values[0])])
             return jsonify({"status": "success"})
 
     return jsonify({"status": "error", "message": "Kode Barang tidak ditemukan"})
 
-def get_sheet_data_with_index(sheet_name):
-    result = sheets_service.spreadsheets().values().get(
-        spreadsheetId=SPREADSHEET_ID,
+def get_sheet_data_with_index(sheet_name, lab=None):
+    lab = lab or current_lab()
+    result = sheets_execute(lab.sheets().values().get(
+        spreadsheetId=lab.spreadsheet_id,
         range=f"{sheet_name}!A2:G"  # Sesuaikan dengan kolom A-E (ID, Date, Item, Category, Amount)
-    ).execute()
+    ))
 
     values = result.get('values', [])
     data_with_index = []
@@ -327,11 +1157,12 @@ def get_sheet_data_with_index(sheet_name):
 
     return data_with_index
 
-def get_sheet_id_by_name(sheet_name):
+def get_sheet_id_by_name(sheet_name, lab=None):
     """
     Mengambil sheetId dari nama sheet/tab.
     """
-    metadata = sheets_service.spreadsheets().get(spreadsheetId=SPREADSHEET_ID).execute()
+    lab = lab or current_lab()
+    metadata = sheets_execute(lab.sheets().get(spreadsheetId=lab.spreadsheet_id))
     for sheet in metadata["sheets"]:
         if sheet["properties"]["title"].lower() == sheet_name.lower():
             return sheet["properties"]["sheetId"]
@@ -344,7 +1175,7 @@ def delete_record(sheet, kode_barang):
         all_data = get_sheet_data_with_index(sheet.capitalize())
 
         for row in all_data:
-            if row["data"][0] == kode_barang:
+            if row["data"] and row["data"][0] == kode_barang:
                 row_index = row["index"] - 1  # 0-based index
                 break
         else:
@@ -352,8 +1183,9 @@ def delete_record(sheet, kode_barang):
 
         sheet_id = get_sheet_id_by_name(sheet.capitalize())
 
-        sheets_service.spreadsheets().batchUpdate(
-            spreadsheetId=SPREADSHEET_ID,
+        lab = current_lab()
+        sheets_execute(lab.sheets().batchUpdate(
+            spreadsheetId=lab.spreadsheet_id,
             body={
                 "requests": [
                     {
@@ -368,58 +1200,47 @@ def delete_record(sheet, kode_barang):
                     }
                 ]
             }
-        ).execute()
+        ))
+        bump_data_version(sheet.capitalize(), [("delete", kode_barang, None)])
 
         return jsonify({"status": "success", "message": "Barang berhasil dihapus"})
     except Exception as e:
         return jsonify({"status": "error", "message": f"Gagal menghapus barang: {e}"})
 
 ## Cetak label barang
-def get_barang_by_kode(kode_barang):
-    # Ambil semua data dari sheet
-    result = sheets_service.spreadsheets().values().get(
-        spreadsheetId=SPREADSHEET_ID,
-        range='Barang!A2:G'
-    ).execute()
-
-    values = result.get('values', [])
-
-    for row in values:
-        if row[0] == kode_barang:
-            return {
-                'kode_barang': row[0],
-                'nama_barang': row[1],
-                'merek': row[2],
-                'kondisi': row[5]
-            }
-
-    return None
-
-@app.route('/cetak-label')
-def cetak_label_batch():
-    kode_list = request.args.get('kode')  # contoh: ?kode=BRG001,BRG002
-    if not kode_list:
-        return "Tidak ada kode barang dipilih", 400
+def get_barang_by_kode(kode_barang, lab=None):
+    return get_record_index("Barang", lab).get(kode_barang)
 
-    kode_barang_list = kode_list.split(',')
+def build_label_docx(kode_barang_list, progress=None, lab=None):
+    """
+    Membuat dokumen DOCX berisi label untuk setiap kode barang.
+    `progress(done, total)` dipanggil setiap satu label selesai (opsional).
+    """
+    barang_index = get_record_index("Barang", lab)
+    total = len(kode_barang_list)
 
     doc = Document()
 
-    for kode_barang in kode_barang_list:
-        barang = get_barang_by_kode(kode_barang.strip())
+    for done, kode_barang in enumerate(kode_barang_list, start=1):
+        barang = barang_index.get(kode_barang)
 
         if not barang:
+            if progress:
+                progress(done, total)
             continue  # Lewati jika tidak ditemukan
 
-        nama_barang = barang['nama_barang']
-        merek = barang['merek']
-        kondisi = barang['kondisi']
+        nama_barang = barang.nama_barang
+        merek = barang.merek
+        kondisi = barang.kondisi
 
         # Generate QR Code
-        qr = qrcode.make(kode_barang)
+        start = time.perf_counter()
+        qr = qrcode.make(label_qr_data(kode_barang))
         qr_io = BytesIO()
         qr.save(qr_io, format='PNG')
         qr_io.seek(0)
+        observe("label_build_duration_seconds", time.perf_counter() - start, stage="qr")
+        start = time.perf_counter()
 
         # Tambahkan section break jika bukan label pertama
         if doc.tables:
@@ -465,25 +1286,511 @@ def cetak_label_batch():
             f"Kondisi   : {kondisi}"
         )
         run2.font.size = Pt(10)
+        observe("label_build_duration_seconds", time.perf_counter() - start, stage="docx")
+
+        if progress:
+            progress(done, total)
 
     # Simpan dokumen ke memory
+    start = time.perf_counter()
     doc_io = BytesIO()
     doc.save(doc_io)
     doc_io.seek(0)
+    observe("label_build_duration_seconds", time.perf_counter() - start, stage="save")
+    return doc_io
+
+#--- Label lembar stiker (PDF/PNG) & printer thermal (ZPL/ESC-POS) ---
+# Label digambar langsung ke gambar seukuran halaman, tanpa lewat object model DOCX.
+LABEL_DPI = int(os.getenv("LABEL_DPI", "300"))
+LABEL_COLS = int(os.getenv("LABEL_COLS", "3"))
+LABEL_ROWS = int(os.getenv("LABEL_ROWS", "8"))
+LABEL_MARGIN_MM = float(os.getenv("LABEL_MARGIN_MM", "8"))
+LABEL_THERMAL_SIZE = os.getenv("LABEL_THERMAL_SIZE", "50x25")  # mm, ukuran satu label printer thermal
+LABEL_QR_BASE_URL = os.getenv("LABEL_QR_BASE_URL", "").rstrip("/")  # mis. https://inventaris.example.com
+LABEL_PAGE_SIZES = {"a4": (210, 297), "letter": (215.9, 279.4)}  # mm
+LABEL_FORMATS = {
+    "docx": ("label_barang.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    "pdf": ("label_barang.pdf", "application/pdf"),
+    "png": ("label_barang.png", "image/png"),
+    "zpl": ("label_barang.zpl", "text/plain"),
+    "escpos": ("label_barang.bin", "application/octet-stream"),
+}
+
+def label_qr_data(kode_barang):
+    # Isi QR code pada label: kode polos, atau URL halaman scan kalau LABEL_QR_BASE_URL diisi
+    if LABEL_QR_BASE_URL:
+        return f"{LABEL_QR_BASE_URL}/scan/{quote(kode_barang, safe='')}"
+    return kode_barang
+
+def label_lines(barang):
+    return [
+        f"Kode      : {barang.kode_barang}",
+        f"Nama      : {barang.nama_barang}",
+        f"Merek     : {barang.merek}",
+        f"Kondisi   : {barang.kondisi}",
+    ]
+
+def label_options(params):
+    """
+    Validasi pilihan label dari query string / body JSON:
+    format, cols, rows, page, margin (mm). ValueError kalau tidak valid.
+    """
+    fmt = str(params.get("format") or "docx").lower()
+    if fmt not in LABEL_FORMATS:
+        raise ValueError(f"Format label tidak dikenal: {fmt}")
+    page = str(params.get("page") or "a4").lower()
+    if page not in LABEL_PAGE_SIZES:
+        raise ValueError(f"Ukuran halaman tidak dikenal: {page}")
+    try:
+        cols = int(params.get("cols") or LABEL_COLS)
+        rows = int(params.get("rows") or LABEL_ROWS)
+        margin = float(params.get("margin") if params.get("margin") not in (None, "") else LABEL_MARGIN_MM)
+    except (TypeError, ValueError):
+        raise ValueError("cols, rows dan margin harus berupa angka")
+    if not (1 <= cols <= 10 and 1 <= rows <= 20 and 0 <= margin <= 30):
+        raise ValueError("cols harus 1-10, rows 1-20, margin 0-30 mm")
+    return {"format": fmt, "cols": cols, "rows": rows, "page": page, "margin": margin}
+
+def _mm(value, dpi=LABEL_DPI):
+    return int(round(value * dpi / 25.4))
+
+@lru_cache(maxsize=16)
+def _label_font(size, bold=False):
+    try:
+        return ImageFont.truetype("DejaVuSans-Bold.ttf" if bold else "DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default(size=size)
+
+def _qr_image(data, size):
+    # Bangun dari matriks QR (quiet zone 2 modul) lalu perbesar tanpa interpolasi, supaya modul tetap tajam
+    # Mask tetap: semua mask valid, pencarian mask terbaik memakan ~90% waktu encode
+    qr = qrcode.QRCode(border=2, error_correction=qrcode.constants.ERROR_CORRECT_M, mask_pattern=0)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    n = len(matrix)
+    img = Image.new("1", (n, n), 1)
+    img.putdata([0 if dark else 1 for row in matrix for dark in row])
+    side = max(n, size // n * n)
+    return img.resize((side, side), Image.NEAREST)
+
+def _fit_text(draw, text, font, width):
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+def render_label_pages(barang_list, cols=LABEL_COLS, rows=LABEL_ROWS, page="a4", margin=LABEL_MARGIN_MM, progress=None):
+    """
+    Menyusun label N-up (cols x rows per halaman) ke gambar hitam-putih seukuran halaman.
+    Generator: setiap halaman (PIL Image) di-yield begitu penuh, supaya pemanggil bisa
+    langsung meng-encode-nya. Satu halaman A4 300 dpi ~8,7 MB di memori, jadi ribuan
+    label tidak boleh ditampung sekaligus.
+    """
+    page_w, page_h = (_mm(v) for v in LABEL_PAGE_SIZES[page])
+    margin_px = _mm(margin)
+    cell_w = (page_w - 2 * margin_px) // cols
+    cell_h = (page_h - 2 * margin_px) // rows
+    pad = _mm(2)
+
+    qr_size = min(cell_h - 2 * pad, int(cell_w * 0.45))
+    title_font = _label_font(max(8, cell_h // 9), bold=True)
+    body_font = _label_font(max(8, cell_h // 12))
+    text_x = pad + qr_size + pad
+    text_w = cell_w - text_x - pad
+
+    per_page = cols * rows
+    total = len(barang_list)
+    page = draw = None
+    for i, barang in enumerate(barang_list):
+        slot = i % per_page
+        if slot == 0:
+            if page is not None:
+                yield page
+            page = Image.new("1", (page_w, page_h), 1)
+            draw = ImageDraw.Draw(page)
+        x = margin_px + (slot % cols) * cell_w
+        y = margin_px + (slot // cols) * cell_h
+
+        qr = _qr_image(label_qr_data(barang.kode_barang), qr_size)
+        page.paste(qr, (x + pad, y + (cell_h - qr.height) // 2))
+
+        line_y = y + pad
+        draw.text((x + text_x, line_y), _fit_text(draw, barang.kode_barang, title_font, text_w), font=title_font, fill=0)
+        line_y += int(title_font.size * 1.4)
+        for text in (barang.nama_barang, barang.merek, barang.kondisi):
+            if line_y + body_font.size > y + cell_h - pad:
+                break
+            draw.text((x + text_x, line_y), _fit_text(draw, text, body_font, text_w), font=body_font, fill=0)
+            line_y += int(body_font.size * 1.3)
+
+        if progress:
+            progress(i + 1, total)
+    if page is not None:
+        yield page
+
+def labels_to_pdf(pages):
+    """
+    PDF ditulis sendiri halaman demi halaman. Image.save(save_all=True) milik Pillow
+    mengumpulkan semua append_images ke list dulu, jadi tidak bisa dipakai untuk streaming.
+    Setiap halaman jadi satu gambar 1-bit (FlateDecode) seukuran halaman.
+    """
+    buf = BytesIO()
+    buf.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = {}
+
+    def write_obj(number, body, stream=None):
+        offsets[number] = buf.tell()
+        buf.write(b"%d 0 obj\n%s" % (number, body))
+        if stream is not None:
+            buf.write(b"\nstream\n%s\nendstream" % stream)
+        buf.write(b"\nendobj\n")
+
+    # Objek 1 (Catalog) dan 2 (Pages) ditulis terakhir, setelah semua halaman diketahui
+    kids = []
+    number = 3
+    for page in pages:
+        width, height = page.size
+        page_w, page_h = width * 72 / LABEL_DPI, height * 72 / LABEL_DPI
+        # Mode "1": 1 bit per piksel, tiap baris dibulatkan ke byte, 1 = putih (sama dengan DeviceGray)
+        data = zlib.compress(page.tobytes(), 6)
+        image_ref, contents_ref, page_ref = number, number + 1, number + 2
+        number += 3
+
+        write_obj(image_ref, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                             b"/BitsPerComponent 1 /Filter /FlateDecode /Length %d >>" % (width, height, len(data)), data)
+        contents = b"q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q" % (page_w, page_h)
+        write_obj(contents_ref, b"<< /Length %d >>" % len(contents), contents)
+        write_obj(page_ref, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+                            b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+                            % (page_w, page_h, image_ref, contents_ref))
+        kids.append(page_ref)
+
+    write_obj(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % ref for ref in kids), len(kids)))
+    write_obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    xref = buf.tell()
+    buf.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+    for ref in range(1, len(offsets) + 1):
+        buf.write(b"%010d 00000 n \n" % offsets[ref])
+    buf.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref))
+    return buf.getvalue()
+
+def _png_bytes(page):
+    buf = BytesIO()
+    page.save(buf, "PNG", dpi=(LABEL_DPI, LABEL_DPI))
+    return buf.getvalue()
+
+def labels_to_png(pages):
+    """
+    Satu halaman -> PNG, lebih dari satu -> ZIP berisi PNG per halaman.
+    Mengembalikan (bytes, jumlah halaman); setiap halaman langsung di-encode lalu dibuang.
+    """
+    pages = iter(pages)
+    first = _png_bytes(next(pages))
+    second = next(pages, None)
+    if second is None:
+        return first, 1
+
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:  # PNG sudah terkompresi
+        zf.writestr("label_barang_001.png", first)
+        count = 1
+        for page in itertools.chain([second], pages):
+            count += 1
+            zf.writestr(f"label_barang_{count:03}.png", _png_bytes(page))
+    return buf.getvalue(), count
+
+def _thermal_size(dpmm):
+    width, _, height = LABEL_THERMAL_SIZE.partition("x")
+    return int(float(width) * dpmm), int(float(height) * dpmm)
+
+def labels_to_zpl(barang_list, progress=None):
+    """ZPL II untuk printer Zebra (203 dpi), satu blok ^XA..^XZ per label."""
+    width, height = _thermal_size(8)  # 203 dpi = 8 dot/mm
+    pad = 16
+    magnification = max(1, min(10, (height - 2 * pad) // 30))
+    text_x = pad + magnification * 30 + pad
+    font_h = max(18, (height - 2 * pad) // 6)
+
+    def text(value):
+        # ^ dan ~ adalah karakter perintah ZPL
+        return str(value).replace("^", " ").replace("~", " ")
+
+    out = []
+    total = len(barang_list)
+    for i, barang in enumerate(barang_list, start=1):
+        out.append(f"^XA^CI28^PW{width}^LL{height}")
+        out.append(f"^FO{pad},{pad}^BQN,2,{magnification}^FDMA,{text(label_qr_data(barang.kode_barang))}^FS")
+        line_y = pad
+        for value in (barang.kode_barang, barang.nama_barang, barang.merek, barang.kondisi):
+            out.append(f"^FO{text_x},{line_y}^A0N,{font_h},{font_h}^FB{width - text_x - pad},1,0,L^FD{text(value)}^FS")
+            line_y += int(font_h * 1.3)
+        out.append("^XZ")
+        if progress:
+            progress(i, total)
+    return ("\n".join(out) + "\n").encode("utf-8")
+
+def labels_to_escpos(barang_list, progress=None):
+    """Perintah ESC/POS untuk printer struk: QR native (GS ( k), teks, lalu potong kertas."""
+    ESC, GS = b"\x1b", b"\x1d"
+
+    def qr_command(fn, payload):
+        size = len(payload) + 2
+        return GS + b"(k" + bytes([size % 256, size // 256, 49, fn]) + payload
+
+    out = bytearray(ESC + b"@")  # reset printer
+    total = len(barang_list)
+    for i, barang in enumerate(barang_list, start=1):
+        data = label_qr_data(barang.kode_barang).encode("utf-8")
+        out += ESC + b"a\x01"  # rata tengah
+        out += qr_command(65, b"\x32\x00")  # model 2
+        out += qr_command(67, b"\x06")  # ukuran modul
+        out += qr_command(69, b"\x31")  # koreksi error M
+        out += qr_command(80, b"\x30" + data)  # simpan data
+        out += qr_command(81, b"\x30")  # cetak
+        out += ESC + b"a\x00" + b"\n"
+        out += ESC + b"E\x01" + barang.kode_barang.encode("cp437", "replace") + b"\n" + ESC + b"E\x00"
+        for line in label_lines(barang)[1:]:
+            out += line.encode("cp437", "replace") + b"\n"
+        out += ESC + b"d\x03" + GS + b"V\x42\x00"  # feed lalu potong
+        if progress:
+            progress(i, total)
+    return bytes(out)
+
+def build_labels(kode_barang_list, options=None, progress=None, lab=None):
+    """
+    Membuat file label dalam format `options["format"]`.
+    Mengembalikan (bytes, download_name, mimetype).
+    """
+    options = options or label_options({})
+    fmt = options["format"]
+    download_name, mimetype = LABEL_FORMATS[fmt]
+
+    barang_index = get_record_index("Barang", lab)
+    barang_list = [barang_index[kode] for kode in kode_barang_list if kode in barang_index]
+    if not barang_list:
+        raise ValueError("Kode barang tidak ditemukan")
+
+    if fmt == "docx":
+        return build_label_docx(kode_barang_list, progress=progress, lab=lab).getvalue(), download_name, mimetype
+
+    start = time.perf_counter()
+    if fmt == "zpl":
+        data = labels_to_zpl(barang_list, progress)
+    elif fmt == "escpos":
+        data = labels_to_escpos(barang_list, progress)
+    else:
+        # Render dan encode berselang-seling per halaman, jadi dicatat sebagai satu tahap
+        pages = render_label_pages(
+            barang_list, options["cols"], options["rows"], options["page"], options["margin"], progress
+        )
+        if fmt == "pdf":
+            data = labels_to_pdf(pages)
+        else:
+            data, page_count = labels_to_png(pages)
+            if page_count > 1:
+                download_name, mimetype = "label_barang.zip", "application/zip"
+    observe("label_build_duration_seconds", time.perf_counter() - start, stage="encode")
+    return data, download_name, mimetype
+
+def parse_kode_list(kode_list):
+    # "BRG001, BRG002,," -> ["BRG001", "BRG002"]
+    return [kode.strip() for kode in kode_list.split(',') if kode.strip()]
+
+@app.route('/cetak-label')
+def cetak_label_batch():
+    kode_list = request.args.get('kode')  # contoh: ?kode=BRG001,BRG002&format=pdf&cols=3&rows=8
+    if not kode_list:
+        return "Tidak ada kode barang dipilih", 400
+
+    try:
+        options = label_options(request.args)
+        data, download_name, mimetype = build_labels(parse_kode_list(kode_list), options)
+    except ValueError as e:
+        return str(e), 400
+
+    return send_file(
+        BytesIO(data),
+        as_attachment=True,
+        download_name=download_name,
+        mimetype=mimetype
+    )
+
+
+## Background jobs (export & label batch)
+# Pekerjaan berat dijalankan di luar request HTTP. Status disimpan sebagai file JSON
+# di JOBS_DIR supaya bisa dibaca oleh worker gunicorn mana pun yang menerima polling.
+# Di serverless (Vercel) thread tidak dijamin selesai setelah response dikirim dan /tmp
+# tidak dibagi antar instance, jadi mode job default-nya mati di sana dan UI memakai
+# /cetak-label yang sinkron. JOBS_ENABLED=1 hanya untuk server dengan disk bersama.
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "0" if os.getenv("VERCEL") else "1") == "1"
+JOB_PROGRESS_INTERVAL = 1.0  # detik minimal antar penulisan progress ke file job
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(tempfile.gettempdir(), "catat-inventaris-jobs"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_HEAVY_LIMIT = int(os.getenv("JOB_HEAVY_LIMIT", "1"))  # maksimal job berat yang jalan bersamaan
+JOB_TTL = int(os.getenv("JOB_TTL", "3600"))  # detik, hasil job dihapus setelah ini
+
+os.makedirs(JOBS_DIR, exist_ok=True)
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+heavy_job_slots = threading.BoundedSemaphore(JOB_HEAVY_LIMIT)
+
+def _job_path(job_id, ext="json"):
+    return os.path.join(JOBS_DIR, f"{job_id}.{ext}")
+
+def _save_job(job):
+    # Tulis atomik: tulis ke file sementara lalu rename
+    tmp_path = _job_path(job["id"], "json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(job, f)
+    os.replace(tmp_path, _job_path(job["id"]))
+
+def load_job(job_id):
+    # job_id selalu uuid4 hex, tolak yang lain supaya tidak bisa keluar dari JOBS_DIR
+    if len(job_id) != 32 or any(c not in "0123456789abcdef" for c in job_id):
+        return None
+    try:
+        with open(_job_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _sweep_jobs():
+    # Hapus status & hasil job yang sudah kedaluwarsa
+    batas = time.time() - JOB_TTL
+    for name in os.listdir(JOBS_DIR):
+        path = os.path.join(JOBS_DIR, name)
+        try:
+            if os.path.getmtime(path) < batas:
+                os.remove(path)
+        except OSError:
+            continue
+
+def _run_job(job, func, args, heavy):
+    last_saved = [0.0]
+
+    def progress(done, total):
+        # Tulis ke disk paling sering sekali per JOB_PROGRESS_INTERVAL, kecuali item terakhir
+        job["progress"] = {"done": done, "total": total}
+        now = time.monotonic()
+        if done >= total or now - last_saved[0] >= JOB_PROGRESS_INTERVAL:
+            last_saved[0] = now
+            _save_job(job)
+
+    slots = heavy_job_slots if heavy else None
+    if slots:
+        slots.acquire()
+    try:
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        _save_job(job)
+
+        data, download_name, mimetype = func(progress, *args)
+        with open(_job_path(job["id"], "bin"), "wb") as f:
+            f.write(data)
+
+        job["status"] = "done"
+        job["download_name"] = download_name
+        job["mimetype"] = mimetype
+    except Exception as e:
+        job["status"] = "error"
+        job["message"] = str(e)
+    finally:
+        if slots:
+            slots.release()
+        job["finished_at"] = time.time()
+        _save_job(job)
+
+def submit_job(kind, func, *args, heavy=True):
+    """
+    Mendaftarkan job baru dan menjalankannya di worker pool.
+    `func(progress, *args)` harus mengembalikan (bytes, download_name, mimetype).
+    """
+    _sweep_jobs()
+    job = {
+        "id": uuid4().hex,
+        "kind": kind,
+        "status": "queued",
+        "progress": {"done": 0, "total": 0},
+        "created_at": time.time(),
+    }
+    _save_job(job)
+    job_executor.submit(_run_job, job, func, args, heavy)
+    return job["id"]
+
+def _label_job(progress, kode_barang_list, options, lab):
+    return build_labels(kode_barang_list, options, progress=progress, lab=lab)
+
+@app.context_processor
+def inject_jobs():
+    return {'jobs_enabled': JOBS_ENABLED}
+
+def job_response(job):
+    data = {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "status_url": url_for("job_status", job_id=job["id"]),
+    }
+    if job["status"] == "done":
+        data["download_url"] = url_for("job_download", job_id=job["id"])
+    if job["status"] == "error":
+        data["message"] = job.get("message", "")
+    return data
+
+@app.route('/jobs/cetak-label', methods=['POST'])
+def submit_cetak_label():
+    if not JOBS_ENABLED:
+        return jsonify({"status": "error", "message": "Mode job tidak aktif, gunakan /cetak-label"}), 503
+
+    params = request.form if request.form else (request.get_json(silent=True) or {})
+    kode_list = params.get('kode', '')
+    if isinstance(kode_list, list):
+        kode_list = ','.join(kode_list)
+
+    kode_barang_list = parse_kode_list(kode_list or '')
+    if not kode_barang_list:
+        return jsonify({"status": "error", "message": "Tidak ada kode barang dipilih"}), 400
+
+    try:
+        options = label_options({**request.args.to_dict(), **params})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    # Job berjalan di luar request, jadi lab aktif ikut diteruskan
+    job_id = submit_job("cetak-label", _label_job, kode_barang_list, options, current_lab())
+    return jsonify(job_response(load_job(job_id))), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = load_job(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Job tidak ditemukan"}), 404
+    return jsonify(job_response(job))
+
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    job = load_job(job_id)
+    if not job or job["status"] != "done":
+        abort(404)
 
     return send_file(
-        doc_io,
+        _job_path(job_id, "bin"),
         as_attachment=True,
-        download_name='label_barang.docx',
-        mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        download_name=job["download_name"],
+        mimetype=job["mimetype"]
     )
 
 
 # Peminjaman
 @app.route('/peminjaman', methods=['GET', 'POST'])
 def peminjaman():
-    barang_list = get_data("Barang")
+    version = current_lab().version
+    barang_list = get_records("Barang")
     available = []
+    options_html = ""
 
     if request.method == 'POST':
         if 'cek_ketersediaan' in request.form:
@@ -491,6 +1798,7 @@ def peminjaman():
             tgl_pinjam = request.form['tgl_pinjam']
             tgl_kembali = request.form['tgl_kembali']
             available = barang_list  # Bisa ditambah pengecekan bentrok jadwal jika diperlukan
+            options_html = render_fragment("peminjaman-options.html", version, available=available)
 
         elif 'submit_peminjaman' in request.form:
             # Step 2: Simpan data peminjaman
@@ -506,7 +1814,229 @@ def peminjaman():
             flash('Peminjaman berhasil disimpan.')
             return redirect(url_for('peminjaman'))
 
-    return render_template('peminjaman.html', barang_list=barang_list, available=available)
+    if request.method == 'POST':
+        return render_template('peminjaman.html', available=available, options_html=options_html)
+
+    etag = page_etag("peminjaman", version)
+    if not_modified(etag):
+        return conditional_response("", etag), 304
+
+    html = render_template('peminjaman.html', available=available, options_html=options_html)
+    return conditional_response(html, etag)
+
+## Multi-lab
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "8"))
+FANOUT_TIMEOUT = float(os.getenv("FANOUT_TIMEOUT", "20"))  # detik, lab yang lebih lambat dianggap gagal
+SEARCH_LIMIT = 50
+
+# Pool terpisah dari job_executor, supaya query lintas lab tidak antre di belakang job label
+fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+
+def fan_out(func, labs=None):
+    """
+    Jalankan func(lab) di beberapa lab (default semua) secara paralel.
+    Mengembalikan (hasil {lab_id: nilai}, errors {lab_id: pesan}); lab yang gagal
+    tidak menggagalkan lab lainnya.
+    """
+    labs = list(LABS.values()) if labs is None else list(labs)
+    results, errors = {}, {}
+
+    if len(labs) == 1:
+        try:
+            results[labs[0].id] = func(labs[0])
+        except Exception as e:
+            errors[labs[0].id] = str(e)
+        return results, errors
+
+    futures = {fanout_executor.submit(func, lab): lab for lab in labs}
+    try:
+        for future in as_completed(futures, timeout=FANOUT_TIMEOUT):
+            lab = futures[future]
+            try:
+                results[lab.id] = future.result()
+            except Exception as e:
+                errors[lab.id] = str(e)
+    except FuturesTimeout:
+        for future, lab in futures.items():
+            if lab.id not in results and lab.id not in errors:
+                future.cancel()
+                errors[lab.id] = "timeout"
+    return results, errors
+
+def labs_for_kode(kode_barang):
+    # Kode barang diawali prefix lab ("KIM-001"), jadi cukup tanya lab pemilik prefix itu
+    prefix = kode_barang.split("-", 1)[0]
+    labs = [lab for lab in LABS.values() if lab.prefix == prefix]
+    return labs or None
+
+@app.route("/lab/<lab_id>", methods=["POST"])
+def pilih_lab(lab_id):
+    if lab_id not in LABS:
+        abort(404)
+    session["lab"] = lab_id
+    return redirect(request.referrer or url_for("inventaris"))
+
+@app.route("/api/cari")
+def api_cari():
+    """
+    Pencarian barang di semua lab sekaligus: ?q=mikroskop
+    """
+    q = request.args.get("q", "").strip().lower()
+    if not q:
+        return jsonify({"status": "error", "message": "Parameter q wajib diisi"}), 400
+    limit = min(request.args.get("limit", SEARCH_LIMIT, type=int), SEARCH_LIMIT * 10)
+
+    def cari(lab):
+        hasil = []
+        for barang in get_records("Barang", lab):
+            if q in barang.kode_barang.lower() or q in barang.nama_barang.lower() or q in barang.merek.lower():
+                hasil.append(dict(barang.to_dict(), lab=lab.id))
+                if len(hasil) >= limit:
+                    break
+        return hasil
+
+    results, errors = fan_out(cari)
+    # Urutan hasil mengikuti urutan lab di konfigurasi, bukan urutan selesai
+    merged = [item for lab_id in LABS if lab_id in results for item in results[lab_id]][:limit]
+    return jsonify({"query": q, "results": merged, "errors": errors})
+
+@app.route("/api/lokasi/<kode_barang>")
+def api_lokasi(kode_barang):
+    """
+    Di lab mana barang ini berada. Lab ditebak dari prefix kode; kalau tidak cocok, tanya semua lab.
+    """
+    def cari(lab):
+        barang = get_barang_by_kode(kode_barang, lab)
+        return barang.to_dict() if barang else None
+
+    results, errors = fan_out(cari, labs_for_kode(kode_barang))
+    found = [
+        {"lab": lab_id, "lab_nama": LABS[lab_id].nama, "barang": barang}
+        for lab_id, barang in results.items() if barang
+    ]
+    status = 200 if found else 404
+    return jsonify({"kode_barang": kode_barang, "ditemukan": found, "errors": errors}), status
+
+## Scan QR
+# Kamera HP membuka /scan/<kode> langsung dari label (LABEL_QR_BASE_URL), dan sesi stock opname
+# mengirim banyak kode sekaligus ke /api/scan. Semua lookup dilayani dari cache record di memori.
+SCAN_MAX_AGE = int(os.getenv("SCAN_MAX_AGE", "10"))  # detik, hasil scan boleh dipakai ulang browser
+SCAN_BATCH_LIMIT = 500
+
+def loan_index(lab):
+    """
+    {kode_barang: [Peminjaman, ...]} dari sheet Peminjaman, dibangun ulang hanya
+    kalau cache sheet itu diperbarui.
+    """
+    entry = _load_records("Peminjaman", lab)
+    cached_entry, index = lab.loan_index
+    if cached_entry is not entry:
+        index = {}
+        for pinjam in entry[1]:
+            if pinjam.kode_barang:
+                index.setdefault(pinjam.kode_barang, []).append(pinjam)
+        lab.loan_index = (entry, index)
+    return index
+
+def scan_kode(value):
+    # Terima kode polos maupun isi QR berupa URL ".../scan/KIM-001"
+    value = str(value).strip()
+    if "/scan/" in value:
+        value = unquote(value.rsplit("/scan/", 1)[1].split("?", 1)[0])
+    return value.strip("/")
+
+def scan_result(kode_barang, lab):
+    barang = get_barang_by_kode(kode_barang, lab)
+    if not barang:
+        return None
+
+    # Sheet Peminjaman tidak mencatat pengembalian, jadi yang bisa dilaporkan hanya
+    # peminjaman terakhir yang tercatat, bukan apakah barang sedang dipinjam
+    pinjaman = loan_index(lab).get(kode_barang, [])
+    terakhir = pinjaman[-1] if pinjaman else None
+    return {
+        "kode_barang": kode_barang,
+        "lab": lab.id,
+        "lab_nama": lab.nama,
+        "barang": barang.to_dict(),
+        "jumlah_peminjaman": len(pinjaman),
+        # Nomor telepon peminjam sengaja tidak ikut, label bisa dipindai siapa saja
+        "peminjaman_terakhir": {"nomor": terakhir.nomor, "nama": terakhir.nama, "instansi": terakhir.instansi} if terakhir else None,
+    }
+
+def scan_lookup(kode_list):
+    """
+    Cari banyak kode sekaligus. Kode dikelompokkan per lab lewat prefix, jadi setiap lab
+    cukup ditanya sekali. Mengembalikan ({kode: hasil atau None}, errors).
+    """
+    kode_per_lab = defaultdict(list)
+    for kode in kode_list:
+        for lab in labs_for_kode(kode) or LABS.values():
+            kode_per_lab[lab.id].append(kode)
+
+    def cari(lab):
+        return {kode: scan_result(kode, lab) for kode in kode_per_lab[lab.id]}
+
+    results, errors = fan_out(cari, [LABS[lab_id] for lab_id in kode_per_lab])
+    found = dict.fromkeys(kode_list)
+    for lab_id in LABS:  # kalau kode ada di beberapa lab, lab pertama di konfigurasi yang dipakai
+        for kode, hasil in results.get(lab_id, {}).items():
+            if hasil and found[kode] is None:
+                found[kode] = hasil
+    return found, errors
+
+def scan_response(payload, status=200):
+    # JSON kecil dengan ETag dari isinya; scan ulang kode yang sama cukup dijawab 304 / cache browser
+    response = jsonify(payload)
+    response.status_code = status
+    response.add_etag()
+    response.headers["Cache-Control"] = f"private, max-age={SCAN_MAX_AGE}"
+    return response.make_conditional(request)
+
+@app.route("/scan", defaults={"kode_barang": None})
+@app.route("/scan/<kode_barang>")
+def scan_page(kode_barang):
+    if not kode_barang:
+        return render_template("scan.html", kode_barang=None, hasil=None, errors={})
+
+    kode_barang = scan_kode(kode_barang)
+    found, errors = scan_lookup([kode_barang])
+    hasil = found[kode_barang]
+    return render_template("scan.html", kode_barang=kode_barang, hasil=hasil, errors=errors), 200 if hasil else 404
+
+@app.route("/api/scan/<kode_barang>")
+def api_scan(kode_barang):
+    kode_barang = scan_kode(kode_barang)
+    found, errors = scan_lookup([kode_barang])
+    hasil = found[kode_barang]
+    if hasil is None:
+        # Lab yang gagal dihubungi belum tentu tidak punya barangnya
+        status = 503 if errors else 404
+        return scan_response({"kode_barang": kode_barang, "status": "tidak_ditemukan", "errors": errors}, status)
+    return scan_response(hasil)
+
+@app.route("/api/scan", methods=["POST"])
+def api_scan_batch():
+    """
+    Lookup banyak kode sekaligus untuk stock opname: {"kode": ["KIM-001", "KIM-002", ...]}
+    """
+    kode_list = (request.get_json(silent=True) or {}).get("kode")
+    if isinstance(kode_list, str):
+        kode_list = parse_kode_list(kode_list)
+    if not kode_list or not isinstance(kode_list, list):
+        return jsonify({"status": "error", "message": "Tidak ada kode barang"}), 400
+    if len(kode_list) > SCAN_BATCH_LIMIT:
+        return jsonify({"status": "error", "message": f"Maksimal {SCAN_BATCH_LIMIT} kode per request"}), 400
+
+    # Urutan dipertahankan, kode yang dipindai dua kali cukup dicari sekali
+    kode_list = list(dict.fromkeys(kode for kode in map(scan_kode, kode_list) if kode))
+    found, errors = scan_lookup(kode_list)
+    return jsonify({
+        "results": found,
+        "jumlah_ditemukan": sum(1 for hasil in found.values() if hasil),
+        "tidak_ditemukan": [kode for kode, hasil in found.items() if hasil is None],
+        "errors": errors,
+    })
 
 ## Unduh annual report pdf
 #@app.route('/annual_report')
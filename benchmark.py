@@ -0,0 +1,194 @@
+"""
+Benchmark & load test aplikasi terhadap server Sheets tiruan (fake_sheets.py).
+
+Contoh:
+    python benchmark.py                          # 1k, 10k, 100k baris
+    python benchmark.py --rows 1000 --requests 200 --concurrency 8 --latency-ms 80
+    python benchmark.py --json hasil.json        # simpan hasil untuk dibandingkan antar commit
+
+Untuk setiap jumlah baris, setiap skenario dijalankan `--requests` kali dan dilaporkan
+throughput, latency p50/p99, jumlah error, dan jumlah panggilan ke Sheets API per request.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import make_server
+
+import fake_sheets
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_sheets(rows, latency_ms, error_rate):
+    fake_app = fake_sheets.create_app(rows=rows, latency_ms=latency_ms, error_rate=error_rate)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # log per request terlalu ramai
+    server = make_server("127.0.0.1", free_port(), fake_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return fake_app, server
+
+
+def load_app(endpoint):
+    # Env harus diisi sebelum app di-import, karena sheets_service dibuat saat import
+    os.environ["SHEETS_API_ENDPOINT"] = endpoint
+    os.environ.setdefault("SPREADSHEET_ID", "benchmark")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    import app as app_module
+    app_module.app.config["WTF_CSRF_ENABLED"] = False
+    return app_module
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def scenarios(rows):
+    """
+    (nama, fungsi(client, i) -> response, reset_cache) untuk setiap skenario.
+    reset_cache=True berarti cache data dikosongkan sebelum setiap request (kondisi terburuk).
+    """
+    def kode(i):
+        # Sebar ke seluruh tabel, supaya pencarian baris tidak selalu di awal
+        return f"LAB-{(i * 7919) % rows + 1:03}"
+
+    edit_form = {
+        "nama_barang": "Barang benchmark",
+        "merek": "Bench",
+        "jumlah": "3",
+        "date": "2025-01-01",
+        "kondisi": "Baik",
+        "keterangan": "",
+    }
+    label_batch = ",".join(kode(i) for i in range(20))
+    scan_batch = {"kode": [kode(i) for i in range(200)]}
+
+    return [
+        ("inventaris", lambda c, i: c.get("/inventaris"), False),
+        ("inventaris (cold)", lambda c, i: c.get("/inventaris"), True),
+        ("peminjaman", lambda c, i: c.get("/peminjaman"), False),
+        ("scan", lambda c, i: c.get(f"/api/scan/{kode(i)}"), False),
+        ("scan batch (200)", lambda c, i: c.post("/api/scan", json=scan_batch), False),
+        ("edit", lambda c, i: c.post(f"/edit/Barang/{kode(i)}", data=edit_form), False),
+        # Hapus dari ujung tabel supaya kode untuk skenario lain tetap ada
+        ("delete", lambda c, i: c.post(f"/delete/Barang/LAB-{rows - i:03}"), False),
+        ("cetak-label (20)", lambda c, i: c.get(f"/cetak-label?kode={label_batch}"), False),
+        ("cetak-label pdf (20)", lambda c, i: c.get(f"/cetak-label?kode={label_batch}&format=pdf"), False),
+    ]
+
+
+def run_scenario(app_module, fake_app, name, func, reset_cache, requests, concurrency):
+    stats = fake_app.config["FAKE_SHEETS_STATS"]
+    upstream_before = sum(v for k, v in stats.items() if k != "429")
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(i):
+        nonlocal errors
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app_module.app.test_client()
+        if reset_cache:
+            app_module.bump_data_version()
+
+        start = time.perf_counter()
+        response = func(client, i)
+        elapsed = time.perf_counter() - start
+
+        failed = response.status_code >= 400
+        if response.is_json and (response.get_json() or {}).get("status") == "error":
+            failed = True
+        with lock:
+            latencies.append(elapsed)
+            if failed:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+
+    upstream_after = sum(v for k, v in stats.items() if k != "429")
+    latencies.sort()
+    return {
+        "scenario": name,
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": requests / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "upstream_calls_per_request": (upstream_after - upstream_before) / requests,
+    }
+
+
+def print_table(rows, results):
+    print(f"\n== {rows} baris ==")
+    print(f"{'skenario':<20} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'sheets/req':>11} {'error':>6}")
+    for r in results:
+        print(
+            f"{r['scenario']:<20} {r['throughput_rps']:>9.1f} {r['p50_ms']:>9.1f} "
+            f"{r['p99_ms']:>9.1f} {r['upstream_calls_per_request']:>11.2f} {r['errors']:>6}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark catat-inventaris dengan Sheets tiruan")
+    parser.add_argument("--rows", default="1000,10000,100000", help="daftar jumlah baris, dipisah koma")
+    parser.add_argument("--requests", type=int, default=50, help="request per skenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=0, help="latency Sheets tiruan per panggilan")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="peluang 429 dari Sheets tiruan")
+    parser.add_argument("--only", help="jalankan skenario yang namanya mengandung teks ini saja")
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    args = parser.parse_args()
+
+    row_counts = [int(r) for r in args.rows.split(",")]
+    fake_app, server = start_fake_sheets(row_counts[0], args.latency_ms, args.error_rate)
+    app_module = load_app(f"http://127.0.0.1:{server.server_port}")
+
+    report = []
+    try:
+        for rows in row_counts:
+            results = []
+            for name, func, reset_cache in scenarios(rows):
+                if args.only and args.only not in name:
+                    continue
+                # Data & cache baru untuk setiap skenario supaya hasilnya tidak saling memengaruhi
+                fake_app.config["FAKE_SHEETS_STATE"]["sheets"] = fake_sheets.seed_sheets(rows)
+                app_module.bump_data_version()
+                results.append(run_scenario(
+                    app_module, fake_app, name, func, reset_cache, args.requests, args.concurrency
+                ))
+            print_table(rows, results)
+            report.append({"rows": rows, "results": results})
+    finally:
+        server.shutdown()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "report": report}, f, indent=2)
+
+    # Exit code != 0 kalau ada request yang gagal, supaya bisa dipakai di CI
+    failed = sum(r["errors"] for entry in report for r in entry["results"])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
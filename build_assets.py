@@ -0,0 +1,183 @@
+"""
+Bundle aset statis: library vendor di-host sendiri, nama file diberi hash isi, dan
+setiap file teks disiapkan dalam versi gzip (dan brotli kalau modul `brotli` terpasang).
+
+    npm run build:css                 # Tailwind -> static/css/output.css (minify)
+    python build_assets.py            # unduh vendor + fingerprint + kompres
+    python build_assets.py --offline  # tanpa unduh, pakai static/vendor yang sudah ada
+
+Hasilnya ada di static/dist/ beserta static/dist/manifest.json, yang dibaca asset_url()
+di app.py. Di Vercel keduanya dijalankan sebagai buildCommand (lihat vercel.json); tanpa
+manifest aplikasi kembali ke file static biasa dan CDN.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import sys
+from urllib.error import URLError
+from urllib.parse import urljoin, urlparse
+from urllib.request import Request, urlopen
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+VENDOR_LIST = os.path.join(STATIC_DIR, "vendor.json")
+
+# Tidak diberi hash: URL service worker harus tetap, sisanya sumber/konfigurasi build
+SKIP = {"service-worker.js", "vendor.json", "css/input.css"}
+COMPRESS_EXT = {".css", ".js", ".json", ".svg", ".ttf", ".eot", ".txt", ".map"}
+COMPRESS_MIN_SIZE = 1024
+# Google Fonts hanya mengirim woff2 ke browser modern
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def download(url):
+    # Hanya library standar, supaya bisa jalan di build Vercel sebelum requirements terpasang
+    with urlopen(Request(url, headers={"User-Agent": USER_AGENT}), timeout=30) as response:
+        return response.read()
+
+
+#--- Vendor ---
+def vendor():
+    """
+    Unduh setiap library di static/vendor.json. File CSS ikut diunduh font/gambarnya,
+    dan url() di dalamnya diubah menunjuk ke salinan lokal.
+    """
+    with open(VENDOR_LIST) as f:
+        assets = json.load(f)
+
+    for name, url in assets.items():
+        data = download(url)
+        if name.endswith(".css"):
+            data = vendor_css_refs(name, url, data.decode("utf-8")).encode("utf-8")
+        write_file(os.path.join(STATIC_DIR, name), data)
+        print(f"vendor  {name} ({len(data) // 1024} KB)")
+
+
+def vendor_css_refs(name, url, css):
+    base_dir = posixpath.dirname(name)
+    fetched = {}
+
+    def local_path(ref):
+        parsed = urlparse(ref)
+        if not parsed.scheme and not ref.startswith("/"):
+            # Path relatif ("../webfonts/x.woff2") dipertahankan apa adanya
+            return posixpath.normpath(posixpath.join(base_dir, parsed.path))
+        # URL absolut (fonts.gstatic.com/...) disimpan di folder files/ di samping CSS
+        return posixpath.join(base_dir, "files", posixpath.basename(parsed.path))
+
+    def replace(match):
+        ref = match.group(2).strip()
+        if ref.startswith(("data:", "#")):
+            return match.group(0)
+        target = local_path(ref)
+        if target not in fetched:
+            fetched[target] = download(urljoin(url, ref))
+            write_file(os.path.join(STATIC_DIR, target), fetched[target])
+        return f"url({posixpath.relpath(target, base_dir)})"
+
+    return CSS_URL.sub(replace, css)
+
+
+#--- Fingerprint & kompres ---
+def static_files():
+    for root, dirs, files in os.walk(STATIC_DIR):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != DIST_DIR]
+        for filename in files:
+            name = os.path.relpath(os.path.join(root, filename), STATIC_DIR).replace(os.sep, "/")
+            if name not in SKIP:
+                yield name
+
+
+def hashed_name(name, data):
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    stem, ext = posixpath.splitext(name)
+    return f"{stem}.{digest}{ext}"
+
+
+def rewrite_css(name, css, manifest):
+    # url() ke file lain di static/ diarahkan ke nama ber-hash, relatif terhadap CSS ini
+    base_dir = posixpath.dirname(name)
+
+    def replace(match):
+        ref = match.group(2).strip()
+        parsed = urlparse(ref)
+        if parsed.scheme or ref.startswith(("data:", "#", "/")):
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(base_dir, parsed.path))
+        if target not in manifest:
+            return match.group(0)
+        new_ref = posixpath.relpath(manifest[target], base_dir)
+        if parsed.query:
+            new_ref += f"?{parsed.query}"
+        if parsed.fragment:
+            new_ref += f"#{parsed.fragment}"
+        return f"url({new_ref})"
+
+    return CSS_URL.sub(replace, css)
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def write_compressed(path, data):
+    if posixpath.splitext(path)[1] not in COMPRESS_EXT or len(data) < COMPRESS_MIN_SIZE:
+        return
+    # mtime=0 supaya hasil build identik kalau isinya sama
+    write_file(path + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli:
+        write_file(path + ".br", brotli.compress(data, quality=11))
+
+
+def fingerprint():
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    manifest = {}
+
+    # File non-CSS dulu, supaya url() di CSS bisa diarahkan ke nama ber-hash
+    for name in sorted(static_files(), key=lambda n: (n.endswith(".css"), n)):
+        with open(os.path.join(STATIC_DIR, name), "rb") as f:
+            data = f.read()
+        if name.endswith(".css"):
+            data = rewrite_css(name, data.decode("utf-8"), manifest).encode("utf-8")
+
+        target = hashed_name(name, data)
+        manifest[name] = target
+        path = os.path.join(DIST_DIR, target)
+        write_file(path, data)
+        write_compressed(path, data)
+
+    write_file(os.path.join(DIST_DIR, "manifest.json"), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    print(f"fingerprint  {len(manifest)} file -> {os.path.relpath(DIST_DIR)}"
+          + ("" if brotli else " (tanpa brotli, `pip install brotli` untuk .br)"))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bangun bundle aset statis catat-inventaris")
+    parser.add_argument("--offline", action="store_true", help="jangan unduh ulang library vendor")
+    args = parser.parse_args()
+
+    if not args.offline:
+        try:
+            vendor()
+        except URLError as e:
+            sys.exit(f"Gagal mengunduh vendor: {e}")
+    fingerprint()
+
+
+if __name__ == "__main__":
+    main()
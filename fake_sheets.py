@@ -0,0 +1,265 @@
+"""
+Server Google Sheets v4 tiruan untuk pengembangan lokal & benchmark.
+
+Mendukung values.get / append / update / batchGet / batchUpdate, spreadsheets.get
+dan spreadsheets.batchUpdate (deleteDimension), dengan latency dan error 429
+yang bisa diatur. Jalankan lalu arahkan aplikasi ke server ini:
+
+    python fake_sheets.py --rows 1000 --latency-ms 80
+    SHEETS_API_ENDPOINT=http://127.0.0.1:8085 SPREADSHEET_ID=fake flask run
+
+Statistik panggilan ada di GET /_stats, isi ulang data lewat POST /_reset?rows=N.
+"""
+import argparse
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from flask import Flask, jsonify, request
+from werkzeug.security import generate_password_hash
+
+KONDISI = ["Baik", "Baik", "Baik", "Rusak Ringan", "Rusak Berat"]
+MEREK = ["Philips", "Olympus", "Memmert", "Ohaus", "Eppendorf", "Thermo"]
+
+
+def seed_sheets(rows):
+    """
+    Data contoh: `rows` barang, rows/10 peminjaman, dan akun admin/admin.
+    Baris pertama setiap sheet adalah header, sama seperti spreadsheet asli.
+    """
+    rng = random.Random(rows)
+    start = date(2020, 1, 1)
+
+    barang = [["Kode", "Nama Barang", "Merek", "Jumlah", "Tanggal", "Kondisi", "Keterangan"]]
+    for i in range(1, rows + 1):
+        barang.append([
+            f"LAB-{i:03}",
+            f"Barang {i}",
+            rng.choice(MEREK),
+            str(rng.randint(1, 50)),
+            (start + timedelta(days=rng.randint(0, 1800))).isoformat(),
+            rng.choice(KONDISI),
+            "",
+        ])
+
+    peminjaman = [["Nomor", "Nama", "Instansi", "Telp", "Kode Barang", "Nama Barang", "Merek"]]
+    for i in range(1, rows // 10 + 1):
+        item = barang[rng.randint(1, rows)] if rows else ["", "", ""]
+        peminjaman.append([f"{i:08x}", f"Peminjam {i}", "Lab Kimia", "0800000000", item[0], item[1], item[2]])
+
+    profil = [["Username", "Password"], ["admin", generate_password_hash("admin")]]
+
+    return {"Barang": barang, "Peminjaman": peminjaman, "Profil": profil}
+
+
+#--- Parsing notasi A1 ---
+def _col_index(letters):
+    index = 0
+    for ch in letters.upper():
+        index = index * 26 + (ord(ch) - 64)
+    return index - 1
+
+def parse_a1(range_name):
+    """
+    "Barang!A2:G" -> ("Barang", baris_awal, baris_akhir, kolom_awal, kolom_akhir), semua 0-based,
+    baris/kolom akhir None berarti sampai ujung data.
+    """
+    sheet, _, cells = range_name.partition("!")
+    sheet = sheet.strip("'")
+    if not cells:
+        return sheet, 0, None, 0, None
+
+    start, _, end = cells.partition(":")
+    m1 = re.fullmatch(r"([A-Za-z]*)(\d*)", start)
+    m2 = re.fullmatch(r"([A-Za-z]*)(\d*)", end) if end else m1
+    if not m1 or not m2:
+        raise ValueError(f"Range tidak valid: {range_name}")
+
+    row_start = int(m1.group(2)) - 1 if m1.group(2) else 0
+    row_end = int(m2.group(2)) - 1 if m2.group(2) else None
+    col_start = _col_index(m1.group(1)) if m1.group(1) else 0
+    col_end = _col_index(m2.group(1)) if m2.group(1) else None
+    if not end and not m1.group(2):
+        row_end = None
+    return sheet, row_start, row_end, col_start, col_end
+
+
+def create_app(rows=1000, latency_ms=0, jitter_ms=0, error_rate=0.0):
+    app = Flask(__name__)
+    state = {
+        "sheets": seed_sheets(rows),
+        "latency_ms": latency_ms,
+        "jitter_ms": jitter_ms,
+        "error_rate": error_rate,
+    }
+    stats = Counter()
+    lock = threading.RLock()
+
+    def sheet_rows(title):
+        for name, values in state["sheets"].items():
+            if name.lower() == title.lower():
+                return values
+        return None
+
+    def read_range(range_name):
+        sheet, r0, r1, c0, c1 = parse_a1(range_name)
+        values = sheet_rows(sheet)
+        if values is None:
+            return None
+        selected = values[r0:None if r1 is None else r1 + 1]
+        result = [row[c0:None if c1 is None else c1 + 1] for row in selected]
+        # Sheets API tidak mengirim baris kosong di ujung range
+        while result and not result[-1]:
+            result.pop()
+        return {"range": range_name, "majorDimension": "ROWS", "values": result}
+
+    def write_range(range_name, new_values):
+        sheet, r0, _, c0, _ = parse_a1(range_name)
+        values = sheet_rows(sheet)
+        for offset, new_row in enumerate(new_values):
+            index = r0 + offset
+            while len(values) <= index:
+                values.append([])
+            row = values[index]
+            while len(row) < c0 + len(new_row):
+                row.append("")
+            row[c0:c0 + len(new_row)] = [str(v) for v in new_row]
+        return {"updatedRange": range_name, "updatedRows": len(new_values)}
+
+    def error(status, message):
+        return jsonify({"error": {"code": status, "message": message, "status": "ERROR"}}), status
+
+    @app.before_request
+    def simulate_upstream():
+        if request.path.startswith("/_"):
+            return None
+        delay = state["latency_ms"] + random.uniform(0, state["jitter_ms"])
+        if delay:
+            time.sleep(delay / 1000)
+        if state["error_rate"] and random.random() < state["error_rate"]:
+            with lock:
+                stats["429"] += 1
+            return error(429, "Quota exceeded for quota metric 'Read requests'")
+        return None
+
+    def count(op):
+        with lock:
+            stats[op] += 1
+
+    @app.get("/v4/spreadsheets/<spreadsheet_id>")
+    def spreadsheets_get(spreadsheet_id):
+        count("spreadsheets.get")
+        sheets = [
+            {"properties": {"sheetId": i, "title": title, "index": i}}
+            for i, title in enumerate(state["sheets"])
+        ]
+        return jsonify({"spreadsheetId": spreadsheet_id, "sheets": sheets})
+
+    @app.post("/v4/spreadsheets/<path:target>")
+    def spreadsheets_post(target):
+        if target.endswith(":batchUpdate") and "/values" not in target:
+            return spreadsheets_batch_update(target.rsplit(":", 1)[0])
+        if target.endswith("/values:batchUpdate"):
+            return values_batch_update()
+        spreadsheet_id, _, rest = target.partition("/values/")
+        range_name, _, method = rest.rpartition(":")
+        if method == "append":
+            return values_append(range_name)
+        return error(404, f"Method tidak dikenal: {target}")
+
+    @app.route("/v4/spreadsheets/<spreadsheet_id>/values/<path:range_name>", methods=["GET", "PUT"])
+    def values_get_or_update(spreadsheet_id, range_name):
+        with lock:
+            if request.method == "PUT":
+                count("values.update")
+                body = request.get_json()
+                return jsonify(write_range(range_name, body.get("values", [])))
+
+            count("values.get")
+            result = read_range(range_name)
+        if result is None:
+            return error(400, f"Unable to parse range: {range_name}")
+        return jsonify(result)
+
+    @app.get("/v4/spreadsheets/<spreadsheet_id>/values:batchGet")
+    def values_batch_get(spreadsheet_id):
+        count("values.batchGet")
+        with lock:
+            value_ranges = [read_range(r) for r in request.args.getlist("ranges")]
+        if any(vr is None for vr in value_ranges):
+            return error(400, "Unable to parse range")
+        return jsonify({"spreadsheetId": spreadsheet_id, "valueRanges": value_ranges})
+
+    def values_append(range_name):
+        count("values.append")
+        body = request.get_json()
+        sheet = parse_a1(range_name)[0]
+        with lock:
+            values = sheet_rows(sheet)
+            if values is None:
+                return error(400, f"Unable to parse range: {range_name}")
+            start = len(values)
+            for row in body.get("values", []):
+                values.append([str(v) for v in row])
+        return jsonify({"updates": {"updatedRange": f"{sheet}!A{start + 1}", "updatedRows": len(body.get("values", []))}})
+
+    def values_batch_update():
+        count("values.batchUpdate")
+        body = request.get_json()
+        with lock:
+            responses = [write_range(item["range"], item.get("values", [])) for item in body.get("data", [])]
+        return jsonify({"responses": responses})
+
+    def spreadsheets_batch_update(spreadsheet_id):
+        count("spreadsheets.batchUpdate")
+        body = request.get_json()
+        titles = list(state["sheets"])
+        with lock:
+            for req in body.get("requests", []):
+                dim = req.get("deleteDimension")
+                if not dim:
+                    continue
+                rng = dim["range"]
+                values = state["sheets"][titles[rng["sheetId"]]]
+                del values[rng["startIndex"]:rng["endIndex"]]
+        return jsonify({"spreadsheetId": spreadsheet_id, "replies": [{} for _ in body.get("requests", [])]})
+
+    @app.get("/_stats")
+    def get_stats():
+        with lock:
+            return jsonify(dict(stats))
+
+    @app.post("/_reset")
+    def reset():
+        with lock:
+            state["sheets"] = seed_sheets(request.args.get("rows", rows, type=int))
+            for key in ("latency_ms", "jitter_ms", "error_rate"):
+                if key in request.args:
+                    state[key] = request.args.get(key, type=float)
+            stats.clear()
+        return jsonify({"status": "ok"})
+
+    app.config["FAKE_SHEETS_STATS"] = stats
+    app.config["FAKE_SHEETS_STATE"] = state
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server Google Sheets v4 tiruan")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--rows", type=int, default=1000, help="jumlah baris Barang awal")
+    parser.add_argument("--latency-ms", type=float, default=0, help="latency tetap per panggilan")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="tambahan latency acak 0..jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="peluang balasan 429 (0..1)")
+    args = parser.parse_args()
+
+    app = create_app(args.rows, args.latency_ms, args.jitter_ms, args.error_rate)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
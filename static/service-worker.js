@@ -1,7 +1,257 @@
+// Service worker catat-inventaris
+// - Aset ber-hash (/assets/): cache-first, isinya tidak pernah berubah
+// - App shell lain (static, library CDN): stale-while-revalidate
+// - Halaman: cache yang masih segar ditampilkan langsung lalu diperbarui di background
+// - Data: snapshot Barang & Peminjaman di IndexedDB, disinkronkan lewat /api/changes
+// - Scan QR saat offline: halaman /scan/<kode> dibuat dari snapshot IndexedDB
+
+const SHELL_CACHE = 'catat-inventaris-shell-v2';
+const PAGE_CACHE = 'catat-inventaris-pages-v1';
+// output.css & library dimuat lewat URL ber-hash, jadi di-cache saat pertama dipakai
+const SHELL_URLS = [
+  '/static/manifest.json',
+  '/static/icons/logo-black.png',
+  '/static/icons/logo-text.png'
+];
+const PAGE_PATHS = ['/inventaris', '/peminjaman'];
+// Halaman berisi token CSRF, jadi jangan pakai halaman cache yang lebih tua dari ini
+const PAGE_MAX_AGE = 30 * 60 * 1000;
+
+const DB_NAME = 'catat-inventaris';
+const DB_VERSION = 1;
+const SYNC_SHEETS = ['Barang', 'Peminjaman'];
+
 self.addEventListener('install', event => {
-  console.log('Service Worker installed');
+  event.waitUntil(
+    caches.open(SHELL_CACHE)
+      .then(cache => cache.addAll(SHELL_URLS))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', event => {
+  const keep = [SHELL_CACHE, PAGE_CACHE];
+  event.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(keys.filter(key => !keep.includes(key)).map(key => caches.delete(key))))
+      .then(() => self.clients.claim())
+      .then(() => syncAll())
+  );
+});
+
+self.addEventListener('message', event => {
+  if (event.data && event.data.type === 'sync') {
+    event.waitUntil(syncAll());
+  }
+});
+
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  const url = new URL(request.url);
+
+  // Penulisan (tambah/edit/hapus/peminjaman): halaman cache jadi basi, sinkronkan data
+  if (request.method !== 'GET') {
+    if (url.origin === self.location.origin) {
+      event.respondWith(fetch(request).then(response => {
+        event.waitUntil(caches.delete(PAGE_CACHE).then(() => syncAll()));
+        return response;
+      }));
+    }
+    return;
+  }
+
+  if (request.mode === 'navigate' && PAGE_PATHS.includes(url.pathname)) {
+    event.respondWith(pageResponse(event));
+    return;
+  }
+
+  if (request.mode === 'navigate' && url.pathname.startsWith('/scan/')) {
+    const kode = decodeURIComponent(url.pathname.slice('/scan/'.length));
+    event.respondWith(fetch(request).catch(() => offlineScanPage(kode)));
+    return;
+  }
+
+  if (url.origin === self.location.origin && url.pathname.startsWith('/assets/')) {
+    event.respondWith(cacheFirst(event, SHELL_CACHE));
+    return;
+  }
+
+  const isShell = url.origin !== self.location.origin || url.pathname.startsWith('/static/');
+  if (isShell) {
+    event.respondWith(staleWhileRevalidate(event, SHELL_CACHE));
+  }
 });
 
-self.addEventListener('fetch', function(event) {
-  // Untuk offline cache atau intercept bisa ditambahkan di sini
-});
\ No newline at end of file
+//--- Strategi cache ---
+function staleWhileRevalidate(event, cacheName) {
+  return caches.open(cacheName).then(cache =>
+    cache.match(event.request).then(cached => {
+      const network = fetch(event.request)
+        .then(response => {
+          // Response opaque dari CDN (no-cors) tetap boleh disimpan
+          if (response.ok || response.type === 'opaque') {
+            cache.put(event.request, response.clone());
+          }
+          return response;
+        });
+
+      if (cached) {
+        event.waitUntil(network.catch(() => null));
+        return cached;
+      }
+      return network;
+    })
+  );
+}
+
+function cacheFirst(event, cacheName) {
+  return caches.open(cacheName).then(cache =>
+    cache.match(event.request).then(cached => cached || fetch(event.request).then(response => {
+      if (response.ok) {
+        cache.put(event.request, response.clone());
+      }
+      return response;
+    }))
+  );
+}
+
+function pageResponse(event) {
+  return caches.open(PAGE_CACHE).then(cache =>
+    cache.match(event.request).then(cached => {
+      // Revalidasi lewat HTTP cache browser, server menjawab 304 kalau data tidak berubah
+      const network = fetch(event.request, { cache: 'no-cache' })
+        .then(response => {
+          if (response.ok) {
+            const headers = new Headers(response.headers);
+            headers.set('X-SW-Cached-At', Date.now().toString());
+            response.clone().blob().then(body =>
+              cache.put(event.request, new Response(body, { status: response.status, headers }))
+            );
+          }
+          event.waitUntil(syncAll().catch(() => null));
+          return response;
+        });
+
+      const cachedAt = cached ? Number(cached.headers.get('X-SW-Cached-At') || 0) : 0;
+      if (cached && Date.now() - cachedAt < PAGE_MAX_AGE) {
+        event.waitUntil(network.catch(() => null));
+        return cached;
+      }
+      // Offline: halaman lama lebih baik daripada error
+      return network.catch(() => cached || Response.error());
+    })
+  );
+}
+
+//--- IndexedDB snapshot ---
+function openDb() {
+  return new Promise((resolve, reject) => {
+    const req = indexedDB.open(DB_NAME, DB_VERSION);
+    req.onupgradeneeded = () => {
+      const db = req.result;
+      // rows: satu record per baris sheet, key = [sheet, kode/nomor]
+      db.createObjectStore('rows', { keyPath: ['sheet', 'key'] });
+      // meta: token versi terakhir per sheet
+      db.createObjectStore('meta', { keyPath: 'sheet' });
+    };
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => reject(req.error);
+  });
+}
+
+function getMeta(db, sheet) {
+  return new Promise((resolve, reject) => {
+    const req = db.transaction('meta').objectStore('meta').get(sheet);
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => reject(req.error);
+  });
+}
+
+function applyDelta(db, delta) {
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(['rows', 'meta'], 'readwrite');
+    const rows = tx.objectStore('rows');
+    const sheet = delta.sheet;
+
+    if (delta.reset) {
+      const range = IDBKeyRange.bound([sheet], [sheet, []]);
+      rows.delete(range);
+      delta.rows.filter(row => row.length).forEach(row => rows.put({ sheet, key: row[0], row }));
+    } else {
+      delta.upserted.forEach(row => rows.put({ sheet, key: row[0], row }));
+      delta.deleted.forEach(key => rows.delete([sheet, key]));
+    }
+    tx.objectStore('meta').put({ sheet, version: delta.version });
+
+    tx.oncomplete = () => resolve();
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+function syncSheet(db, sheet) {
+  return getMeta(db, sheet).then(meta => {
+    const params = new URLSearchParams({ sheet });
+    if (meta && meta.version) {
+      params.set('since', meta.version);
+    }
+    return fetch(`/api/changes?${params}`, { credentials: 'same-origin' })
+      .then(response => {
+        if (!response.ok) {
+          throw new Error(`Sync ${sheet} gagal: ${response.status}`);
+        }
+        return response.json();
+      })
+      .then(delta => applyDelta(db, delta));
+  });
+}
+
+let syncing = null;
+function syncAll() {
+  // Satu sinkronisasi dalam satu waktu, panggilan lain menunggu yang sama
+  if (!syncing) {
+    syncing = openDb()
+      .then(db => Promise.all(SYNC_SHEETS.map(sheet => syncSheet(db, sheet))))
+      .finally(() => { syncing = null; });
+  }
+  return syncing;
+}
+
+//--- Scan offline ---
+function getRows(db, sheet) {
+  return new Promise((resolve, reject) => {
+    const range = IDBKeyRange.bound([sheet], [sheet, []]);
+    const req = db.transaction('rows').objectStore('rows').getAll(range);
+    req.onsuccess = () => resolve(req.result.map(record => record.row));
+    req.onerror = () => reject(req.error);
+  });
+}
+
+function escapeHtml(value) {
+  return String(value || '').replace(/[&<>"']/g, ch => `&#${ch.charCodeAt(0)};`);
+}
+
+function offlineScanPage(kode) {
+  return openDb()
+    .then(db => Promise.all([getRows(db, 'Barang'), getRows(db, 'Peminjaman')]))
+    .then(([barang, peminjaman]) => {
+      // Kolom sama dengan sheet: Barang [kode, nama, merek, jumlah, tanggal, kondisi, keterangan],
+      // Peminjaman [nomor, nama, instansi, telp, kode_barang, ...]
+      const row = barang.find(r => r[0] === kode);
+      const pinjam = peminjaman.filter(r => r[4] === kode).pop();
+      let body = `<p>Barang <b>${escapeHtml(kode)}</b> tidak ada di data offline.</p>`;
+      if (row) {
+        // Sheet Peminjaman tidak mencatat pengembalian, jadi hanya peminjaman terakhir
+        const status = pinjam
+          ? `Peminjaman terakhir: ${escapeHtml(pinjam[1])} (${escapeHtml(pinjam[2])})`
+          : 'Belum pernah dipinjam';
+        body = `<h2>${escapeHtml(kode)}</h2><p><b>${status}</b></p>
+          <p>Nama: ${escapeHtml(row[1])}<br>Merek: ${escapeHtml(row[2])}<br>Jumlah: ${escapeHtml(row[3])}<br>
+          Tanggal: ${escapeHtml(row[4])}<br>Kondisi: ${escapeHtml(row[5])}<br>Keterangan: ${escapeHtml(row[6]) || '-'}</p>`;
+      }
+      const html = `<!DOCTYPE html><html><head><meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0"><title>Scan Barang</title></head>
+        <body style="font-family: sans-serif; padding: 1rem">${body}
+        <p style="color: #6b7280; font-size: 0.875rem">Offline, data dari sinkronisasi terakhir.</p></body></html>`;
+      return new Response(html, { headers: { 'Content-Type': 'text/html; charset=utf-8' } });
+    });
+}